@@ -0,0 +1,165 @@
+"""Content addressed cache of simulation results.
+
+A run is identified by a hash of the canonical serialization of everything it depends on: the simulator, its
+settings (but their name) and the organisms' traits with every default filled in, whether it stops at
+equilibrium, its seed, the kernel backend and a hash of the source code itself. Runs are given as jobs, as in
+distributed.py. Their result blobs are stored under that key, so repeating or overlapping experiments (sweeps,
+searches, the same configuration under a new name or spelling out its defaults) read back what was already
+computed instead of simulating it again. The least recently used entries are evicted once the cache grows beyond
+its size limit."""
+
+import hashlib
+import json
+import os
+from functools import lru_cache
+from wallawin.src.data_representation import DATA_PATH
+from wallawin.src.cli import SIMULATORS
+from wallawin.src.settings import KERNEL_SETTINGS, Traits
+
+# Entries of a job that determine its results.
+KEY_FIELDS = ('simulator', 'settings', 'altruistic_traits', 'selfish_traits', 'strategy_traits', 'equilibrium', 'seed')
+
+
+@lru_cache(maxsize=None)
+def code_version():
+    """Return a hash of the source files of the package, which changes whenever the code does."""
+
+    root = os.path.dirname(os.path.abspath(__file__))
+    digest = hashlib.sha256()
+    for directory, subdirectories, files in sorted(os.walk(root)):
+        subdirectories.sort()
+        for name in sorted(files):
+            if name.endswith('.py'):
+                file_path = os.path.join(directory, name)
+                digest.update(os.path.relpath(file_path, root).encode())
+                with open(file_path, 'rb') as f:
+                    digest.update(f.read())
+
+    return digest.hexdigest()
+
+
+def canonical(value):
+    """Normalize a value so equal configurations serialize equally: integral floats become ints and tuples
+    become lists."""
+
+    if isinstance(value, dict):
+        return {str(key): canonical(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [canonical(item) for item in value]
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+
+def job_key(job):
+    """Return the key of the results of a job."""
+
+    spec = {field: job[field] for field in KEY_FIELDS if field in job}
+    # Settings and traits as the simulator sees them, so spelling out a default does not change the key.
+    settings = vars(SIMULATORS[job['simulator']][1](**job['settings']))
+    spec['settings'] = {name: value for name, value in settings.items() if name != 'simulation_name'}
+    for field in ('altruistic_traits', 'selfish_traits'):
+        if field in spec:
+            spec[field] = vars(Traits(**spec[field]))
+    if 'strategy_traits' in spec:
+        spec['strategy_traits'] = [vars(Traits(**traits)) for traits in spec['strategy_traits']]
+    spec['equilibrium'] = bool(spec.get('equilibrium', False))
+    spec['backend'] = KERNEL_SETTINGS['BACKEND']
+    spec['code'] = code_version()
+    serialized = json.dumps(canonical(spec), sort_keys=True, separators=(',', ':'))
+
+    return hashlib.sha256(serialized.encode()).hexdigest()
+
+
+class ResultCache:
+    """Result blobs on a directory, one file per key (under a subdirectory named after its first two characters).
+    Reading an entry touches its file, so modification times order entries by last use. Writes are atomic, so
+    several processes may share a cache.
+
+    Attributes
+    ----------
+    path : str
+        Directory of the cache.
+    max_bytes : int
+        Size the entries are evicted down to, least recently used first.
+    """
+
+    def __init__(self, path=None, max_bytes=1 << 30):
+        self.path = path or '{}/cache'.format(DATA_PATH)
+        self.max_bytes = max_bytes
+        os.makedirs(self.path, exist_ok=True)
+
+    def file(self, key):
+        return '{}/{}/{}.npz'.format(self.path, key[:2], key)
+
+    def get(self, key):
+        """Return the blob stored under key, or None if there is none."""
+
+        try:
+            with open(self.file(key), 'rb') as f:
+                blob = f.read()
+            os.utime(self.file(key))
+        except FileNotFoundError:
+            return None
+
+        return blob
+
+    def put(self, key, blob):
+        """Store a blob under key and evict old entries if the cache grew too large."""
+
+        os.makedirs('{}/{}'.format(self.path, key[:2]), exist_ok=True)
+        tmp = '{}/{}/.{}.{}.tmp'.format(self.path, key[:2], key, os.getpid())
+        with open(tmp, 'wb') as f:
+            f.write(blob)
+        os.replace(tmp, self.file(key))
+        self.evict()
+
+    def entries(self):
+        """Return the (last use, size, path) of every entry."""
+
+        entries = []
+        for directory in os.listdir(self.path):
+            directory = '{}/{}'.format(self.path, directory)
+            if not os.path.isdir(directory):
+                continue
+            for name in os.listdir(directory):
+                if name.endswith('.npz'):
+                    try:
+                        stat = os.stat('{}/{}'.format(directory, name))
+                    except FileNotFoundError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, '{}/{}'.format(directory, name)))
+
+        return entries
+
+    def evict(self):
+        """Remove the least recently used entries until the cache fits in max_bytes."""
+
+        entries = sorted(self.entries())
+        size = sum(entry[1] for entry in entries)
+        for last_use, entry_size, file_path in entries:
+            if size <= self.max_bytes:
+                break
+            try:
+                os.remove(file_path)
+            except FileNotFoundError:
+                pass
+            size -= entry_size
+
+    def run(self, job):
+        """Return the result blob of a job, running it only if it is not cached.
+
+        Parameters
+        ----------
+        job : dict
+            Run spec, as in distributed.py."""
+
+        from wallawin.src.distributed import run_job
+
+        key = job_key(job)
+        blob = self.get(key)
+        if blob is None:
+            blob = run_job(job)
+            self.put(key, blob)
+
+        return blob
@@ -0,0 +1,159 @@
+"""Command line entry point. Runs a simulator from a TOML or JSON settings file:
+
+    python -m wallawin.src.cli simulation.toml --replicates 100
+
+The file names the simulator and holds the keyword arguments of its settings and organisms' traits:
+
+    simulator = "PredictableDoveOrHawk"
+
+    [settings]
+    steps = 100
+    pop_size = 10
+    abundance = 2
+    rep_factor = 100
+    simulation_name = "test_1"
+
+    [altruistic_traits]
+    altruistic = true
+    longevity = 2
+
+    [selfish_traits]
+    altruistic = false
+    longevity = 2
+
+PayoffGame files list the traits of each of their strategies instead, as [[strategy_traits]] tables, and
+its settings take the strategies and payoff keys.
+
+Simulators are imported only once chosen and nothing is plotted unless asked to, so headless runs never
+load matplotlib."""
+
+import argparse
+import json
+from importlib import import_module
+from wallawin.src.settings import SimSettings, DoveHawkSettings, GameSettings, Traits, KERNEL_SETTINGS
+
+# Simulator name: (module, settings class).
+SIMULATORS = {'PredictableDoveOrHawk': ('wallawin.src.simulators.altruisms.dove_or_hawk', DoveHawkSettings),
+              'Charity': ('wallawin.src.simulators.altruisms.charity', SimSettings),
+              'PayoffGame': ('wallawin.src.simulators.games', GameSettings)}
+
+
+def load_config(path):
+    """Read a settings file, TOML or JSON depending on its extension."""
+
+    if path.endswith('.toml'):
+        import tomllib
+        with open(path, 'rb') as f:
+            return tomllib.load(f)
+
+    with open(path) as f:
+        return json.load(f)
+
+
+def build(config):
+    """Return the simulator class, its settings and the organisms' traits described by a configuration."""
+
+    module, settings_class = SIMULATORS[config['simulator']]
+    simulator_class = getattr(import_module(module), config['simulator'])
+    sim_settings = settings_class(**config['settings'])
+    if 'strategy_traits' in config:
+        org_traits = [Traits(**traits) for traits in config['strategy_traits']]
+    else:
+        org_traits = [Traits(**config['altruistic_traits']), Traits(**config['selfish_traits'])]
+
+    return simulator_class, sim_settings, org_traits
+
+
+def run_cached(config, sim_settings, replicates, seed, equilibrium, cache):
+    """Run the replicates of a configuration as seeded jobs served from a result cache, writing them on a new
+    results store. Return the store and the states detected on the replicates."""
+
+    from wallawin.src.distributed import read_blob
+    from wallawin.src.results import ResultsStore
+
+    store, states = None, []
+    for replicate in range(replicates):
+        job = dict(config, id='replicate_{}'.format(replicate), seed=seed + replicate, equilibrium=equilibrium)
+        data, metrics, equilibria = read_blob(cache.run(job))
+        if store is None:
+            store = ResultsStore.create(sim_settings.simulation_name, metrics, replicates, sim_settings.steps + 1)
+        store.array[replicate, :len(data)] = data[:sim_settings.steps + 1]
+        for equilibrium_data in equilibria.values():
+            states.append(equilibrium_data['State'])
+            print('Replicate {} : {} at epoch {} (frequency {})'.format(replicate, equilibrium_data['State'],
+                                                                       equilibrium_data['Epoch'],
+                                                                       equilibrium_data['Frequency']))
+
+    return store, states
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='wallawin', description='Run a Wallawin simulation.')
+    parser.add_argument('config', help='TOML or JSON settings file.')
+    parser.add_argument('--replicates', type=int, default=1, help='Number of independent runs.')
+    parser.add_argument('--backend', choices=('python', 'numba'), default=KERNEL_SETTINGS['BACKEND'])
+    parser.add_argument('--equilibrium', action='store_true',
+                        help='Stop each run once equilibrium, fixation or extinction is reached.')
+    parser.add_argument('--plot', action='store_true', help='Plot the aggregated results.')
+    parser.add_argument('--monitor', action='store_true',
+                        help='Publish live metrics, followed with python -m wallawin.src.telemetry NAME.')
+    parser.add_argument('--cache', nargs='?', const='', default=None, metavar='DIRECTORY',
+                        help='Serve the replicates from a result cache (data/cache by default), running and caching '
+                             'the missing ones. Replicates are seeded from --seed on.')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the first replicate when caching.')
+    args = parser.parse_args(argv)
+
+    from wallawin.src.results import ResultsStore, aggregate, comparison_table
+
+    KERNEL_SETTINGS['BACKEND'] = args.backend
+    config = load_config(args.config)
+    simulator_class, sim_settings, org_traits = build(config)
+    store, telemetry, states = None, None, []
+
+    if args.cache is not None:
+        from wallawin.src.cache import ResultCache
+        store, states = run_cached(config, sim_settings, args.replicates, args.seed, args.equilibrium,
+                                   ResultCache(args.cache or None))
+    else:
+        from wallawin.src.equilibrium import EquilibriumDetector
+
+        detector = None
+        for replicate in range(args.replicates):
+            simulator = simulator_class(sim_settings, *org_traits)
+            if args.equilibrium and detector is None:
+                detector = EquilibriumDetector.from_metrics(simulator.metrics)
+            if args.monitor:
+                telemetry = telemetry or simulator.monitor()
+                simulator.telemetry = telemetry
+            if store is None:
+                store = ResultsStore.create(sim_settings.simulation_name, simulator.metrics, args.replicates,
+                                            sim_settings.steps + 1)
+            simulator.simulate(store=store, replicate=replicate, detector=detector)
+            for run, equilibrium in simulator.equilibria.items():
+                states.append(equilibrium['State'])
+                print('Replicate {} : {} at epoch {} (frequency {})'.format(replicate + run, equilibrium['State'],
+                                                                           equilibrium['Epoch'],
+                                                                           equilibrium['Frequency']))
+
+    store.flush()
+    if telemetry is not None:
+        telemetry.finish()
+
+    if args.equilibrium:
+        # Settled replicates are carried forward, so the tables below mix them with those still evolving.
+        print('\nSettled {} of {} replicates : {}'.format(len(states), args.replicates, ', '.join(
+            '{} {}'.format(state, states.count(state)) for state in sorted(set(states))) or 'none'))
+
+    agg = aggregate(store)
+    for metric in agg.metrics:
+        if metric == 'Population Size' or metric.endswith('Population Percentage'):
+            print('\n{}\n{}'.format(metric.upper(), comparison_table([agg], metric)))
+
+    if args.plot:
+        from wallawin.src.data_representation import compare_plot
+        for metric in agg.metrics:
+            compare_plot([agg], metric, sim_settings.simulation_name)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,6 @@
-from matplotlib import pyplot
-from matplotlib.patches import Circle, Patch
+"""Plotting and saving of simulation data. Matplotlib is only imported by the functions that plot, so
+simulations that don't plot never load it."""
+
 from wallawin.src.settings import PLOT_SETTINGS
 import numpy as np
 import os
@@ -9,6 +10,9 @@ DATA_PATH = os.path.abspath(os.pardir) + '/data'
 def plot_env(generation, food, step_num, gen_num):
     """Function that plots a particular step of the evolutionary simulation."""
 
+    from matplotlib import pyplot
+    from matplotlib.patches import Circle
+
     figure, axis = pyplot.subplots()
     figure.set_size_inches(9.6, 5.4)
 
@@ -40,6 +44,9 @@ def plot_env(generation, food, step_num, gen_num):
 
 def share_or_take_plot(data, name):
 
+    from matplotlib import pyplot
+    from matplotlib.patches import Patch
+
     figure2, axis = pyplot.subplots()
     x_axis = np.array(list(data.keys()))
     # Iterate through each step on the data dictionary getting the relevant data.
@@ -75,6 +82,36 @@ def share_or_take_plot(data, name):
 
 
 def save_simulation_settings(settings, name):
-    os.mkdir('{}/{}'.format(DATA_PATH, name))
+    os.makedirs('{}/{}'.format(DATA_PATH, name), exist_ok=True)
     f = open('{}/{}/settings.txt'.format(DATA_PATH, name), "w+")
     f.write(str(settings))
+
+
+def compare_plot(aggregates, metric, name):
+    """Plot the mean of a metric across the replicates of several simulations, each one surrounded by
+    the band between its lowest and highest computed quantiles.
+
+    Parameters
+    ----------
+    aggregates : list
+        Aggregate objects (see results.aggregate) of the simulations to compare.
+    metric : str
+        Name of the metric to plot.
+    name : str
+        Name of the comparison. The plot is saved under DATA_PATH/comparisons/name."""
+
+    from matplotlib import pyplot
+
+    figure, axis = pyplot.subplots()
+    for agg in aggregates:
+        i = agg.index(metric)
+        x_axis = np.arange(len(agg.count))
+        line, = pyplot.plot(x_axis, agg.mean[:, i], label=agg.name)
+        pyplot.fill_between(x_axis, agg.bands[0, :, i], agg.bands[-1, :, i], color=line.get_color(), alpha=0.25)
+
+    pyplot.legend()
+    pyplot.xlabel("Generations")
+    pyplot.ylabel(metric)
+    os.makedirs('{}/comparisons/{}'.format(DATA_PATH, name), exist_ok=True)
+    pyplot.savefig("{}/comparisons/{}/{}".format(DATA_PATH, name, metric.lower().replace(' ', '_')))
+    pyplot.close(figure)
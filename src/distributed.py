@@ -0,0 +1,360 @@
+"""Distribution of simulation runs among worker daemons on any number of nodes.
+
+A job is a JSON serializable run spec, the same mapping the command line reads from a settings file plus an id
+and a seed:
+
+    {'id': 'sweep_0001', 'seed': 1, 'simulator': 'PredictableDoveOrHawk', 'settings': {...},
+     'altruistic_traits': {...}, 'selfish_traits': {...}, 'equilibrium': False}
+
+The coordinator puts jobs on a work queue, workers pull them, run them and push back a compressed blob with
+the per-epoch metrics. FileQueue is a queue on a directory, which serves a single machine or every node
+sharing a file system. Workers are started with:
+
+    python -m wallawin.src.distributed worker QUEUE_DIRECTORY"""
+
+import argparse
+import io
+import json
+import os
+import random
+import socket
+import threading
+import time
+import numpy as np
+from wallawin.src import kernels
+from wallawin.src.cli import build
+from wallawin.src.exc import SimulationError
+from wallawin.src.results import ResultsStore
+
+PENDING, RUNNING, DONE, FAILED = 'pending', 'running', 'done', 'failed'
+
+
+def run_job(job):
+    """Run the simulation described by a job and return its compressed result blob."""
+
+    from wallawin.src.equilibrium import EquilibriumDetector
+
+    random.seed(job['seed'])
+    np.random.seed(job['seed'])
+    if kernels.enabled():
+        kernels.seed(job['seed'])
+    simulator_class, sim_settings, org_traits = build(job)
+    simulator = simulator_class(sim_settings, *org_traits)
+    metrics = simulator.metrics
+    store = ResultsStore(sim_settings.simulation_name, metrics,
+                         np.full((1, sim_settings.steps + 1, len(metrics)), np.nan))
+
+    detector = EquilibriumDetector.from_metrics(metrics) if job.get('equilibrium') else None
+    simulator.simulate(store=store, replicate=0, detector=detector)
+
+    blob = io.BytesIO()
+    np.savez_compressed(blob, data=store.array[0], metrics=np.array(metrics),
+                        equilibria=np.array(json.dumps(simulator.equilibria, default=float)))
+    return blob.getvalue()
+
+
+def read_blob(blob):
+    """Return the per-epoch metrics array, the metric names and the equilibria held by a result blob."""
+
+    with np.load(io.BytesIO(blob)) as f:
+        return f['data'], f['metrics'].tolist(), json.loads(str(f['equilibria']))
+
+
+class WorkQueue:
+    """Base class for work queues. Jobs go through the PENDING, RUNNING, DONE and FAILED states."""
+
+    def put(self, job):
+        """Add a job as pending."""
+        pass
+
+    def claim(self, worker):
+        """Atomically take a pending job, mark it as running and return it. Return None if there is none."""
+        pass
+
+    def heartbeat(self, job_id):
+        """Signal the running job is still being worked on."""
+        pass
+
+    def complete(self, job_id, blob):
+        """Store the result blob of a running job and mark it as done."""
+        pass
+
+    def fail(self, job_id, error):
+        """Mark a running job as failed, recording the error."""
+        pass
+
+    def jobs(self, state):
+        """Return the ids of the jobs in a given state."""
+        pass
+
+    def job(self, job_id, state):
+        """Return a job in a given state."""
+        pass
+
+    def last_heartbeat(self, job_id):
+        """Return the time of the last heartbeat of a running job."""
+        pass
+
+    def requeue(self, job_id, state):
+        """Move a running or failed job back to pending, counting a new attempt."""
+        pass
+
+    def result(self, job_id):
+        """Return the result blob of a done job."""
+        pass
+
+
+class FileQueue(WorkQueue):
+    """Work queue on a directory holding one subdirectory per state with a JSON file per job, plus the
+    result blobs. Jobs are claimed by renaming their file, which is atomic, so any number of workers (on
+    any node that can see the directory) may pull from it."""
+
+    def __init__(self, path):
+        self.path = path
+        for directory in (PENDING, RUNNING, DONE, FAILED, 'results'):
+            os.makedirs('{}/{}'.format(path, directory), exist_ok=True)
+
+    def file(self, job_id, state):
+        return '{}/{}/{}.json'.format(self.path, state, job_id)
+
+    def write(self, job, state):
+        tmp = '{}/{}/.{}.tmp'.format(self.path, state, job['id'])
+        with open(tmp, 'w') as f:
+            json.dump(job, f)
+        os.replace(tmp, self.file(job['id'], state))
+
+    def put(self, job):
+        job.setdefault('attempts', 0)
+        self.write(job, PENDING)
+
+    def claim(self, worker):
+        for name in sorted(os.listdir('{}/{}'.format(self.path, PENDING))):
+            if not name.endswith('.json'):
+                continue
+            job_id = name[:-len('.json')]
+            try:
+                os.rename(self.file(job_id, PENDING), self.file(job_id, RUNNING))
+            except FileNotFoundError:
+                # Another worker claimed it first.
+                continue
+            self.heartbeat(job_id)
+            return self.job(job_id, RUNNING)
+
+        return None
+
+    def heartbeat(self, job_id):
+        os.utime(self.file(job_id, RUNNING))
+
+    def complete(self, job_id, blob):
+        tmp = '{}/results/.{}.tmp'.format(self.path, job_id)
+        with open(tmp, 'wb') as f:
+            f.write(blob)
+        os.replace(tmp, '{}/results/{}.npz'.format(self.path, job_id))
+        os.replace(self.file(job_id, RUNNING), self.file(job_id, DONE))
+
+    def fail(self, job_id, error):
+        job = self.job(job_id, RUNNING)
+        job['error'] = error
+        self.write(job, FAILED)
+        os.remove(self.file(job_id, RUNNING))
+
+    def jobs(self, state):
+        return [name[:-len('.json')] for name in os.listdir('{}/{}'.format(self.path, state))
+                if name.endswith('.json')]
+
+    def job(self, job_id, state):
+        with open(self.file(job_id, state)) as f:
+            return json.load(f)
+
+    def last_heartbeat(self, job_id):
+        return os.path.getmtime(self.file(job_id, RUNNING))
+
+    def requeue(self, job_id, state):
+        job = self.job(job_id, state)
+        job['attempts'] += 1
+        job.pop('error', None)
+        self.write(job, PENDING)
+        os.remove(self.file(job_id, state))
+
+    def result(self, job_id):
+        with open('{}/results/{}.npz'.format(self.path, job_id), 'rb') as f:
+            return f.read()
+
+
+def work(queue, name=None, poll_interval=1.0, heartbeat_interval=10.0, once=False, cache=None):
+    """Worker daemon loop: pull jobs from the queue, run them and push their results back.
+
+    Parameters
+    ----------
+    queue : WorkQueue
+        The queue to pull jobs from.
+    name : str
+        Name of the worker. Host name and process id by default.
+    poll_interval : float
+        Seconds to wait before looking again at an empty queue.
+    heartbeat_interval : float
+        Seconds between heartbeats of a running job.
+    once : bool
+        If true, return as soon as the queue is empty instead of waiting for more jobs.
+    cache : ResultCache
+        If given, jobs whose results are cached are not run again."""
+
+    name = name or '{}-{}'.format(socket.gethostname(), os.getpid())
+
+    while True:
+        job = queue.claim(name)
+        if job is None:
+            if once:
+                return
+            time.sleep(poll_interval)
+            continue
+
+        running = threading.Event()
+        running.set()
+
+        def beat(job_id=job['id']):
+            while running.is_set():
+                time.sleep(heartbeat_interval)
+                if running.is_set():
+                    try:
+                        queue.heartbeat(job_id)
+                    except FileNotFoundError:
+                        # The coordinator took the job back.
+                        return
+
+        threading.Thread(target=beat, daemon=True).start()
+        try:
+            blob = cache.run(job) if cache is not None else run_job(job)
+        except Exception as e:
+            running.clear()
+            try:
+                queue.fail(job['id'], '{}: {}'.format(type(e).__name__, e))
+            except FileNotFoundError:
+                pass
+            continue
+
+        running.clear()
+        try:
+            queue.complete(job['id'], blob)
+        except FileNotFoundError:
+            pass
+
+
+class Coordinator:
+    """Submits jobs to a queue, tracks their state and retries the failed ones or those whose worker
+    stopped sending heartbeats.
+
+    Attributes
+    ----------
+    queue : WorkQueue
+        The queue jobs are submitted to.
+    max_attempts : int
+        Times a job is tried before it is given up as failed.
+    timeout : float
+        Seconds without heartbeats after which a running job is considered lost and requeued.
+    """
+
+    def __init__(self, queue, max_attempts=3, timeout=60.0):
+        self.queue = queue
+        self.max_attempts = max_attempts
+        self.timeout = timeout
+        self.submitted = []
+
+    def submit(self, jobs):
+        """Put jobs on the queue.
+
+        Parameters
+        ----------
+        jobs : list
+            Run specs, each one with a unique id."""
+
+        for job in jobs:
+            self.queue.put(job)
+            self.submitted.append(job['id'])
+
+    def states(self):
+        """Return a dictionary mapping each state to the ids of the submitted jobs in it."""
+
+        submitted = set(self.submitted)
+        return {state: [x for x in self.queue.jobs(state) if x in submitted]
+                for state in (PENDING, RUNNING, DONE, FAILED)}
+
+    def retry(self):
+        """Requeue failed jobs with attempts left, counting lost running jobs (those with no heartbeat for timeout
+        seconds) as failed. Return the ids of the jobs given up."""
+
+        for job_id in self.states()[RUNNING]:
+            try:
+                if time.time() - self.queue.last_heartbeat(job_id) > self.timeout:
+                    self.queue.fail(job_id, 'Lost: no heartbeat for {} seconds.'.format(self.timeout))
+            except FileNotFoundError:
+                # It finished meanwhile.
+                pass
+
+        given_up = []
+        for job_id in self.states()[FAILED]:
+            if self.queue.job(job_id, FAILED)['attempts'] + 1 < self.max_attempts:
+                self.queue.requeue(job_id, FAILED)
+            else:
+                given_up.append(job_id)
+
+        return given_up
+
+    def wait(self, poll_interval=1.0):
+        """Block until every submitted job is done or given up. Return the ids of the jobs given up."""
+
+        while True:
+            given_up = self.retry()
+            states = self.states()
+            if len(states[DONE]) + len(given_up) == len(self.submitted):
+                return given_up
+            time.sleep(poll_interval)
+
+    def gather(self, name, epochs):
+        """Write the results of every done job on a new results store, a replicate per job in submission order.
+        The metrics of the store are those recorded on the result blobs, which must all agree.
+
+        Parameters
+        ----------
+        name : str
+            Name of the store.
+        epochs : int
+            Number of epochs of the store."""
+
+        done = set(self.queue.jobs(DONE))
+        store = None
+        for replicate, job_id in enumerate(self.submitted):
+            if job_id not in done:
+                continue
+            data, metrics = read_blob(self.queue.result(job_id))[:2]
+            if store is None:
+                store = ResultsStore.create(name, metrics, len(self.submitted), epochs)
+            elif tuple(metrics) != store.metrics:
+                raise SimulationError('Job {} recorded the metrics {}, other jobs of {} recorded {}.'
+                                      .format(job_id, metrics, name, list(store.metrics)))
+            store.array[replicate, :min(epochs, len(data))] = data[:epochs]
+
+        if store is None:
+            raise SimulationError('No job of {} is done.'.format(name))
+        store.flush()
+
+        return store
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='wallawin.distributed', description='Run a Wallawin worker daemon.')
+    parser.add_argument('command', choices=('worker',))
+    parser.add_argument('queue', help='Directory of the file queue.')
+    parser.add_argument('--name', default=None, help='Name of the worker.')
+    parser.add_argument('--once', action='store_true', help='Exit when the queue is empty.')
+    parser.add_argument('--cache', default=None, help='Directory of a result cache to serve repeated jobs from.')
+    args = parser.parse_args(argv)
+
+    from wallawin.src.cache import ResultCache
+
+    work(FileQueue(args.queue), args.name, once=args.once,
+         cache=ResultCache(args.cache) if args.cache is not None else None)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+"""Online detection of the end of the evolutionary dynamics of a simulation: equilibrium of the alleles'
+frequencies, fixation of one of the alleles or extinction of the population."""
+
+from collections import deque
+import numpy as np
+
+EQUILIBRIUM = 'Equilibrium'
+FIXATION = 'Fixation'
+EXTINCTION = 'Extinction'
+
+
+class EquilibriumDetector:
+    """Watches the data of each epoch of a simulation (as gathered by get_step_data) and decides when
+    nothing else is to be learned from running it.
+
+    Fixation is reached when at most one of the populations given by alleles is left, extinction when the whole
+    population is empty. Equilibrium is reached when, over the last window epochs, every watched frequency has
+    a standard deviation below std_tolerance and the means of both halves of the window differ by less than
+    drift_tolerance.
+
+    Attributes
+    ----------
+    metric : str or tuple
+        Frequency, or frequencies, watched for equilibrium.
+    alleles : tuple
+        Keys of the absolute populations of each allele, watched for fixation.
+    window : int
+        Number of epochs the equilibrium test is run on.
+    drift_tolerance : float
+        Highest difference between the mean frequency of both halves of the window considered stable.
+    std_tolerance : float
+        Highest standard deviation of the frequency in the window considered stable.
+    min_epochs : int
+        Equilibrium will not be declared before this epoch.
+    state : str
+        EQUILIBRIUM, FIXATION or EXTINCTION once detected, None before.
+    epoch : int
+        Epoch at which the state was reached. For equilibrium, the first epoch of the stable window.
+    frequency : float or list
+        Frequency at the detected state (one per watched metric if several). For equilibrium, the mean frequency
+        of the stable window.
+    """
+
+    def __init__(self, metric='Selfish Population Percentage',
+                 alleles=('Altruistic Population', 'Selfish Population'), window=20, drift_tolerance=0.01,
+                 std_tolerance=0.05, min_epochs=0):
+        self.metric = metric
+        self.alleles = alleles
+        self.window = window
+        self.drift_tolerance = drift_tolerance
+        self.std_tolerance = std_tolerance
+        self.min_epochs = min_epochs
+        self.reset()
+
+    @classmethod
+    def from_metrics(cls, metrics, **kwargs):
+        """Return a detector for a simulator with the given metrics: its alleles are the '<name> Population'
+        counts, and the frequencies of all of them but the first are watched for equilibrium (the first one's
+        is determined by the others).
+
+        Parameters
+        ----------
+        metrics : tuple
+            Keys of the data gathered by the simulator each epoch, i.e. its metrics attribute.
+        kwargs
+            Any other argument of the detector."""
+
+        alleles = tuple(metric for metric in metrics if metric.endswith(' Population'))
+        watched = tuple('{} Percentage'.format(allele) for allele in alleles[1:]
+                        if '{} Percentage'.format(allele) in metrics)
+        if not alleles or not watched:
+            raise ValueError('No allele populations and frequencies among the metrics {}.'.format(metrics))
+
+        return cls(watched[0] if len(watched) == 1 else watched, alleles, **kwargs)
+
+    def reset(self):
+        """Forget everything seen so the detector can watch a new run."""
+
+        self.values = deque(maxlen=self.window)
+        self.state = None
+        self.epoch = None
+        self.frequency = None
+
+    def update(self, epoch, step_data):
+        """Take the data of a new epoch and return True if the simulation may stop.
+
+        Parameters
+        ----------
+        epoch : int
+            Current epoch of the simulation.
+        step_data : dict
+            Data of the epoch."""
+
+        if step_data['Population Size'] == 0:
+            return self.reach(EXTINCTION, epoch, np.nan)
+
+        if sum(step_data[allele] > 0 for allele in self.alleles) <= 1:
+            return self.reach(FIXATION, epoch, self.watched(step_data))
+
+        self.values.append(self.watched(step_data))
+        if len(self.values) < self.window or epoch < self.min_epochs:
+            return False
+
+        values = np.array(self.values).reshape(self.window, -1)
+        half = self.window // 2
+        drift = np.abs(values[:half].mean(axis=0) - values[half:].mean(axis=0))
+        if (drift < self.drift_tolerance).all() and (values.std(axis=0) < self.std_tolerance).all():
+            mean = values.mean(axis=0).tolist()
+            return self.reach(EQUILIBRIUM, epoch - self.window + 1, mean[0] if isinstance(self.metric, str) else mean)
+
+        return False
+
+    def watched(self, step_data):
+        """Return the watched frequency, or the list of them, on the data of an epoch."""
+
+        if isinstance(self.metric, str):
+            return step_data[self.metric]
+        return [step_data[metric] for metric in self.metric]
+
+    def reach(self, state, epoch, frequency):
+        self.state = state
+        self.epoch = epoch
+        self.frequency = frequency
+        return True
+
+    def summary(self):
+        return {'State': self.state, 'Epoch': self.epoch, 'Frequency': self.frequency}
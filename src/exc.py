@@ -0,0 +1,5 @@
+"""Exceptions raised by Wallawin."""
+
+
+class SimulationError(Exception):
+    """Raised when a simulation can't be carried out, e.g. when one of its worker processes fails."""
@@ -0,0 +1,189 @@
+"""Compiled kernels for the phases of the simulations that are inherently sequential: food claiming,
+sharing matches and pair resolution. They work on arrays extracted from the organisms and are compiled
+with Numba when KERNEL_SETTINGS['BACKEND'] is 'numba'. If Numba is not installed the simulators keep
+using their pure Python methods. Numba is only imported once the kernels are first needed."""
+
+from importlib.util import find_spec
+import numpy as np
+from wallawin.src.settings import KERNEL_SETTINGS
+
+AVAILABLE = find_spec('numba') is not None
+
+_warm = False
+
+
+def claim_food(pos, meals, velocity, active, food_pos, food_left, feading_range):
+    """Make each active organism, in order, eat the nearest remaining food particle if it is within feading
+    range or move towards it otherwise. Organisms that already ate two meals or find no food left become
+    inactive. All arrays are modified in place.
+
+    Parameters
+    ----------
+    pos : array
+        Positions of the organisms, shape (n, 2).
+    meals : array
+        Meals of the organisms.
+    velocity : array
+        Distance each organism moves per step. Zero for organisms without energy.
+    active : array
+        Boolean mask of the organisms still competing.
+    food_pos : array
+        Positions of the food particles, shape (m, 2).
+    food_left : array
+        Boolean mask of the food particles not eaten yet.
+    feading_range : float
+        Distance at which an organism can eat a food particle."""
+
+    remaining = 0
+    for j in range(food_left.shape[0]):
+        if food_left[j]:
+            remaining += 1
+
+    for i in range(pos.shape[0]):
+        if not active[i]:
+            continue
+        if remaining == 0 or meals[i] >= 2:
+            active[i] = False
+            continue
+
+        nearest, nearest_dist = -1, np.inf
+        for j in range(food_pos.shape[0]):
+            if food_left[j]:
+                d = (food_pos[j, 0] - pos[i, 0]) ** 2 + (food_pos[j, 1] - pos[i, 1]) ** 2
+                if d < nearest_dist:
+                    nearest, nearest_dist = j, d
+
+        nearest_dist = np.sqrt(nearest_dist)
+        if nearest_dist < feading_range:
+            meals[i] += 1
+            food_left[nearest] = False
+            remaining -= 1
+        else:
+            ratio = velocity[i] / nearest_dist
+            pos[i, 0] += ratio * (food_pos[nearest, 0] - pos[i, 0])
+            pos[i, 1] += ratio * (food_pos[nearest, 1] - pos[i, 1])
+
+
+def match_sharers(meals, altruistic, recipients_order):
+    """Pair each altruistic organism with two or more meals with an altruistic organism with none, in the
+    order given by recipients_order, moving a meal from the first to the second. Return the (sharer, recipient)
+    index pairs.
+
+    Parameters
+    ----------
+    meals : array
+        Meals of the organisms. Modified in place.
+    altruistic : array
+        Boolean mask of the altruistic organisms.
+    recipients_order : array
+        A permutation of the organisms' indexes. Recipients are picked following it."""
+
+    pairs = np.empty((meals.shape[0], 2), dtype=np.int64)
+    matched = 0
+    k = 0
+    for i in range(meals.shape[0]):
+        if not altruistic[i] or meals[i] < 2:
+            continue
+        while k < recipients_order.shape[0]:
+            r = recipients_order[k]
+            k += 1
+            if altruistic[r] and meals[r] == 0:
+                meals[i] -= 1
+                meals[r] += 1
+                pairs[matched, 0] = i
+                pairs[matched, 1] = r
+                matched += 1
+                break
+        if k >= recipients_order.shape[0]:
+            break
+
+    return pairs[:matched]
+
+
+def resolve_pairs(strategy, order, food_amount, payoff):
+    """Make each organism, in the given order, pick a random food particle not chosen by two organisms yet
+    and return the meals of each organism once encounters are resolved: one meal if it found its food alone,
+    payoff[own_strategy, rival_strategy] if it had to compete for it.
+
+    Parameters
+    ----------
+    strategy : array
+        Strategy index of each organism (0 for selfish, 1 for altruistic in Dove/Hawk simulations).
+    order : array
+        A permutation of the organisms' indexes. Organisms choose food following it.
+    food_amount : int
+        Amount of food particles in the environment.
+    payoff : array
+        Square matrix of meals obtained by an organism competing with another, indexed by both strategies."""
+
+    meals = np.zeros(strategy.shape[0])
+    first = np.full(food_amount, -1, dtype=np.int64)
+    second = np.full(food_amount, -1, dtype=np.int64)
+    available = np.arange(food_amount)
+    n_available = food_amount
+
+    for i in order:
+        if n_available == 0:
+            break
+        k = np.random.randint(0, n_available)
+        f = available[k]
+        if first[f] == -1:
+            first[f] = i
+        else:
+            second[f] = i
+            available[k] = available[n_available - 1]
+            n_available -= 1
+
+    for f in range(food_amount):
+        a, b = first[f], second[f]
+        if a == -1:
+            continue
+        if b == -1:
+            meals[a] += 1
+        else:
+            meals[a] = payoff[strategy[a], strategy[b]]
+            meals[b] = payoff[strategy[b], strategy[a]]
+
+    return meals
+
+
+def seed(value):
+    """Seed the random number generator the kernels draw from. Compiled kernels use Numba's own generator,
+    which seeding NumPy's from Python does not reach.
+
+    Parameters
+    ----------
+    value : int
+        The seed."""
+
+    np.random.seed(value)
+
+
+def warm_up():
+    """Compile every kernel and run it on tiny inputs. Compiled kernels are cached on disk, so only the first
+    process that ever uses them pays the compilation time; the rest only load them."""
+
+    global _warm, claim_food, match_sharers, resolve_pairs, seed
+    from numba import njit
+
+    seed = njit(cache=True)(seed)
+    claim_food = njit(cache=True)(claim_food)
+    match_sharers = njit(cache=True)(match_sharers)
+    resolve_pairs = njit(cache=True)(resolve_pairs)
+    claim_food(np.zeros((1, 2)), np.zeros(1), np.ones(1), np.ones(1, dtype=np.bool_), np.ones((1, 2)),
+               np.ones(1, dtype=np.bool_), 1.0)
+    match_sharers(np.array([2.0, 0.0]), np.ones(2, dtype=np.bool_), np.arange(2))
+    resolve_pairs(np.zeros(2, dtype=np.int64), np.arange(2), 1, np.zeros((2, 2)))
+    seed(0)
+    _warm = True
+
+
+def enabled():
+    """Return True if the simulators should use the compiled kernels, warming them up the first time."""
+
+    if KERNEL_SETTINGS['BACKEND'] != 'numba' or not AVAILABLE:
+        return False
+    if not _warm:
+        warm_up()
+
+    return True
@@ -0,0 +1,199 @@
+"""Compact recording of the genealogy of a simulation.
+
+Each organism gets an id and each birth appends a (child, parent, birth epoch) record to growable integer
+arrays. Every few epochs the records are simplified: lineages with no living descendant are pruned and dead
+ancestors with a single remaining descendant line are skipped over, so memory stays proportional to the living
+population rather than to everything ever born. Founder shares are counted online, on every epoch."""
+
+import numpy as np
+
+
+class LineageRecorder:
+    """Genealogy of a simulation. Ids grow with time, so a record's parent always precedes it.
+
+    Attributes
+    ----------
+    simplify_interval : int
+        Epochs between simplifications of the records.
+    epoch : int
+        Epoch births are currently recorded at.
+    alive : set
+        Ids of the living organisms.
+    founder_counts : list
+        Number of living organisms descending from each founder at the end of every epoch.
+    """
+
+    def __init__(self, simplify_interval=50, capacity=1024):
+        self.simplify_interval = simplify_interval
+        self.epoch = 0
+        self.alive = set()
+        self.founder_counts = []
+        self.child = np.empty(capacity, dtype=np.int64)
+        self.parent = np.empty(capacity, dtype=np.int64)
+        self.birth = np.empty(capacity, dtype=np.int64)
+        self.founder = np.empty(capacity, dtype=np.int64)
+        self.size = 0
+        self.next_id = 0
+        self.founders = 0
+
+    def append(self, parent, founder):
+        if self.size == len(self.child):
+            for name in ('child', 'parent', 'birth', 'founder'):
+                array = getattr(self, name)
+                setattr(self, name, np.concatenate([array, np.empty_like(array)]))
+
+        org_id = self.next_id
+        self.child[self.size] = org_id
+        self.parent[self.size] = parent
+        self.birth[self.size] = self.epoch
+        self.founder[self.size] = founder
+        self.size += 1
+        self.next_id += 1
+        self.alive.add(org_id)
+
+        return org_id
+
+    def found(self, organisms):
+        """Record organisms as founders of their own lineages.
+
+        Parameters
+        ----------
+        organisms : list
+            The initial population."""
+
+        for org in organisms:
+            org.founder = self.founders
+            org.lineage_id = self.append(-1, org.founder)
+            self.founders += 1
+
+    def record_birth(self, child, parent):
+        """Record the birth of child from parent. The child inherits its parent's founder.
+
+        Parameters
+        ----------
+        child : Organism
+            The newborn organism.
+        parent : Organism
+            Its parent."""
+
+        child.founder = parent.founder
+        child.lineage_id = self.append(parent.lineage_id, parent.founder)
+
+    def record_death(self, org):
+        self.alive.discard(org.lineage_id)
+
+    def census(self, generation):
+        """Count the living organisms descending from each founder, close the current epoch and simplify the
+        records if it is time to.
+
+        Parameters
+        ----------
+        generation : list
+            The living organisms."""
+
+        self.founder_counts.append(np.bincount([org.founder for org in generation], minlength=self.founders))
+        self.epoch += 1
+        if self.epoch % self.simplify_interval == 0:
+            self.simplify()
+
+    def rows(self, ids):
+        return np.searchsorted(self.child[:self.size], ids)
+
+    def simplify(self):
+        """Prune the records of lineages without living descendants and skip over dead records left with a single
+        descendant line, linking their child to their own parent. Founders are always kept."""
+
+        n = self.size
+        child, parent = self.child[:n], self.parent[:n]
+        alive = np.isin(child, np.fromiter(self.alive, dtype=np.int64, count=len(self.alive)))
+
+        # Keep the ancestors of every living organism.
+        keep, frontier = alive.copy(), alive.copy()
+        while frontier.any():
+            parents = parent[frontier]
+            reached = np.zeros(n, dtype=bool)
+            reached[self.rows(parents[parents >= 0])] = True
+            frontier = reached & ~keep
+            keep |= frontier
+
+        # Skip dead records with a single kept child.
+        kept_parents = parent[keep]
+        children = np.bincount(self.rows(kept_parents[kept_parents >= 0]), minlength=n)
+        skip = keep & ~alive & (children == 1) & (parent >= 0)
+        new_parent = parent.copy()
+        while True:
+            has_parent = new_parent >= 0
+            jumping = np.zeros(n, dtype=bool)
+            jumping[has_parent] = skip[self.rows(new_parent[has_parent])]
+            if not jumping.any():
+                break
+            new_parent[jumping] = parent[self.rows(new_parent[jumping])]
+
+        keep &= ~skip
+        size = int(keep.sum())
+        self.child[:size] = child[keep]
+        self.parent[:size] = new_parent[keep]
+        self.birth[:size] = self.birth[:n][keep]
+        self.founder[:size] = self.founder[:n][keep]
+        self.size = size
+
+    def mrca(self):
+        """Return the id of the most recent common ancestor of the living organisms (which may be one of them),
+        or None if they descend from different founders or there are none."""
+
+        self.simplify()
+        n = self.size
+        if not self.alive:
+            return None
+
+        descendants = np.isin(self.child[:n], list(self.alive)).astype(np.int64)
+        parent_rows = np.full(n, -1, dtype=np.int64)
+        has_parent = self.parent[:n] >= 0
+        parent_rows[has_parent] = self.rows(self.parent[:n][has_parent])
+        # Children come after their parents, so one backwards pass accumulates every subtree.
+        for row in range(n - 1, -1, -1):
+            if parent_rows[row] >= 0:
+                descendants[parent_rows[row]] += descendants[row]
+
+        common = np.flatnonzero(descendants == len(self.alive))
+        return int(self.child[common[-1]]) if common.size else None
+
+    def founder_shares(self):
+        """Return the share of the living population descending from each founder at the end of every epoch,
+        shape (epochs, founders)."""
+
+        counts = np.array(self.founder_counts, dtype=np.float64).reshape(-1, self.founders)
+        totals = counts.sum(axis=1, keepdims=True)
+        return np.divide(counts, totals, out=np.zeros_like(counts), where=totals > 0)
+
+    def save(self, path):
+        """Save the simplified records, the living ids and the founder counts to a compressed npz file.
+
+        Parameters
+        ----------
+        path : str
+            Path of the file."""
+
+        self.simplify()
+        n = self.size
+        np.savez_compressed(path, child=self.child[:n], parent=self.parent[:n], birth=self.birth[:n],
+                            founder=self.founder[:n], alive=np.array(sorted(self.alive), dtype=np.int64),
+                            founder_counts=np.array(self.founder_counts, dtype=np.int64).reshape(-1, self.founders))
+
+    @classmethod
+    def load(cls, path):
+        """Load a recorder saved with save."""
+
+        with np.load(path) as f:
+            recorder = cls(capacity=max(1, len(f['child'])))
+            n = len(f['child'])
+            recorder.child[:n], recorder.parent[:n] = f['child'], f['parent']
+            recorder.birth[:n], recorder.founder[:n] = f['birth'], f['founder']
+            recorder.size = n
+            recorder.alive = set(f['alive'].tolist())
+            recorder.founder_counts = list(f['founder_counts'])
+            recorder.founders = f['founder_counts'].shape[1]
+            recorder.epoch = len(recorder.founder_counts)
+            recorder.next_id = int(f['child'].max()) + 1 if n else 0
+
+        return recorder
@@ -0,0 +1,272 @@
+"""Storage of per-epoch simulation metrics and their aggregation across replicates.
+
+Each simulation (i.e. each settings variant, identified by its simulation_name) owns a fixed-layout
+memory-mapped array of shape (replicates, epochs, metrics) stored in DATA_PATH/<simulation_name>/results.npy.
+Replicates that stop early because their dynamics ended (their population went extinct or an equilibrium
+detector settled it) carry their last epoch forward, so they keep counting in the aggregates of later epochs.
+Epochs a replicate never reached otherwise are left as NaN."""
+
+import os
+import warnings
+import numpy as np
+from numpy.lib.format import open_memmap
+from wallawin.src.data_representation import DATA_PATH
+
+
+class ResultsStore:
+    """Memory-mapped per-epoch metrics of all the replicates of a simulation.
+
+    Attributes
+    ----------
+    name : str
+        Name of the simulation the results belong to.
+    metrics : tuple
+        Names of the recorded metrics, in the order of the last axis of the array.
+    array : numpy.memmap
+        Array of shape (replicates, epochs, metrics) backed by the results file.
+    """
+
+    def __init__(self, name, metrics, array):
+        self.name = name
+        self.metrics = tuple(metrics)
+        self.array = array
+
+    @staticmethod
+    def path(name):
+        return '{}/{}'.format(DATA_PATH, name)
+
+    @classmethod
+    def create(cls, name, metrics, replicates, epochs):
+        """Create an empty (NaN filled) store for a simulation, overwriting any previous one.
+
+        Parameters
+        ----------
+        name : str
+            Name of the simulation.
+        metrics : tuple
+            Names of the metrics to record. Usually the metrics attribute of the simulator class.
+        replicates : int
+            Number of replicates (independent runs) the store has room for.
+        epochs : int
+            Number of epochs recorded per replicate."""
+
+        os.makedirs(cls.path(name), exist_ok=True)
+        array = open_memmap('{}/results.npy'.format(cls.path(name)), mode='w+', dtype=np.float64,
+                            shape=(replicates, epochs, len(metrics)))
+        array[:] = np.nan
+        with open('{}/metrics.txt'.format(cls.path(name)), 'w') as f:
+            f.write('\n'.join(metrics))
+
+        return cls(name, metrics, array)
+
+    @classmethod
+    def open(cls, name, mode='r'):
+        """Open the existing store of a simulation.
+
+        Parameters
+        ----------
+        name : str
+            Name of the simulation.
+        mode : str
+            'r' for read only access, 'r+' to keep recording on it."""
+
+        with open('{}/metrics.txt'.format(cls.path(name))) as f:
+            metrics = f.read().split('\n')
+        array = open_memmap('{}/results.npy'.format(cls.path(name)), mode=mode)
+
+        return cls(name, metrics, array)
+
+    @property
+    def replicates(self):
+        return self.array.shape[0]
+
+    @property
+    def epochs(self):
+        return self.array.shape[1]
+
+    def record(self, replicate, epoch, step_data):
+        """Write the data of a single epoch of a replicate.
+
+        Parameters
+        ----------
+        replicate : int
+            Index of the replicate.
+        epoch : int
+            Epoch the data belongs to. Epochs beyond the store's capacity are ignored.
+        step_data : dict
+            Dictionary mapping metric names to their values, as gathered by get_step_data."""
+
+        if epoch < self.epochs:
+            self.array[replicate, epoch] = [step_data[metric] for metric in self.metrics]
+
+    def record_replicates(self, first_replicate, epoch, step_data, mask=None):
+        """Write the data of a single epoch of consecutive replicates simulated together.
+
+        Parameters
+        ----------
+        first_replicate : int
+            Index of the first replicate.
+        epoch : int
+            Epoch the data belongs to. Epochs beyond the store's capacity are ignored.
+        step_data : dict
+            Dictionary mapping metric names to arrays with their value on each replicate.
+        mask : array
+            If given, only replicates where it is true are written."""
+
+        if epoch < self.epochs:
+            values = np.column_stack([step_data[metric] for metric in self.metrics])
+            replicates = np.arange(first_replicate, first_replicate + len(values))
+            if mask is not None:
+                replicates, values = replicates[mask], values[mask]
+            self.array[replicates, epoch] = values
+
+    def fill(self, replicate):
+        """Carry the last recorded epoch of a replicate forward into every later epoch, with no growth, for runs
+        stopped once their dynamics ended.
+
+        Parameters
+        ----------
+        replicate : int
+            Index of the replicate."""
+
+        reached = np.flatnonzero(~np.isnan(self.array[replicate, :, 0]))
+        if len(reached) and reached[-1] + 1 < self.epochs:
+            last = reached[-1]
+            self.array[replicate, last + 1:] = self.array[replicate, last]
+            if 'Population Growth Rate' in self.metrics:
+                self.array[replicate, last + 1:, self.metrics.index('Population Growth Rate')] = 0
+
+    def flush(self):
+        self.array.flush()
+
+
+class Aggregate:
+    """Statistics of a simulation's metrics across its replicates, epoch by epoch.
+
+    Attributes
+    ----------
+    name : str
+        Name of the aggregated simulation.
+    metrics : tuple
+        Names of the metrics, in the order of the last axis of the arrays.
+    quantiles : tuple
+        Quantiles computed for each epoch and metric.
+    count : array
+        Number of replicates that reached each epoch.
+    mean : array
+        Mean of each metric per epoch, shape (epochs, metrics).
+    var : array
+        Variance of each metric per epoch, shape (epochs, metrics).
+    bands : array
+        Quantiles of each metric per epoch, shape (quantiles, epochs, metrics).
+    """
+
+    def __init__(self, name, metrics, quantiles, count, mean, var, bands):
+        self.name = name
+        self.metrics = tuple(metrics)
+        self.quantiles = tuple(quantiles)
+        self.count = count
+        self.mean = mean
+        self.var = var
+        self.bands = bands
+
+    def index(self, metric):
+        return self.metrics.index(metric)
+
+    def save(self):
+        np.savez('{}/aggregate.npz'.format(ResultsStore.path(self.name)), metrics=np.array(self.metrics),
+                 quantiles=np.array(self.quantiles), count=self.count, mean=self.mean, var=self.var,
+                 bands=self.bands)
+
+    @classmethod
+    def load(cls, name):
+        with np.load('{}/aggregate.npz'.format(ResultsStore.path(name))) as f:
+            return cls(name, f['metrics'].tolist(), f['quantiles'].tolist(), f['count'], f['mean'], f['var'],
+                       f['bands'])
+
+
+def aggregate(store, quantiles=(0.05, 0.5, 0.95), block_epochs=64):
+    """Compute the mean, variance and quantile bands of every metric across the replicates of a store.
+    The store is read in blocks of epochs, so no more than block_epochs epochs of every replicate are
+    held in memory at once.
+
+    Parameters
+    ----------
+    store : ResultsStore
+        The store to aggregate.
+    quantiles : tuple
+        Quantiles (between 0 and 1) to compute.
+    block_epochs : int
+        Number of epochs read from disk at a time."""
+
+    shape = (store.epochs, len(store.metrics))
+    count = np.zeros(store.epochs, dtype=np.int64)
+    mean, var = np.full(shape, np.nan), np.full(shape, np.nan)
+    bands = np.full((len(quantiles),) + shape, np.nan)
+
+    for start in range(0, store.epochs, block_epochs):
+        stop = min(start + block_epochs, store.epochs)
+        block = np.asarray(store.array[:, start:stop])
+        count[start:stop] = np.sum(~np.isnan(block[:, :, 0]), axis=0)
+        with warnings.catch_warnings():
+            # Epochs no replicate reached are all NaN and stay so.
+            warnings.simplefilter('ignore', RuntimeWarning)
+            mean[start:stop] = np.nanmean(block, axis=0)
+            var[start:stop] = np.nanvar(block, axis=0)
+            bands[:, start:stop] = np.nanquantile(block, quantiles, axis=0)
+
+    result = Aggregate(store.name, store.metrics, quantiles, count, mean, var, bands)
+    result.save()
+    return result
+
+
+def run_replicates(simulator_class, sim_settings, replicates, *org_traits):
+    """Run a simulator several times with the same settings recording every replicate in a new store.
+
+    Parameters
+    ----------
+    simulator_class : type
+        The simulator to run, e.g. PredictableDoveOrHawk.
+    sim_settings : SimSettings
+        Settings of the simulation. Its simulation_name names the store.
+    replicates : int
+        Number of independent runs.
+    org_traits : Traits
+        Traits passed to the simulator after the settings, e.g. the altruistic and selfish traits."""
+
+    store = None
+    for replicate in range(replicates):
+        simulator = simulator_class(sim_settings, *org_traits)
+        if store is None:
+            store = ResultsStore.create(sim_settings.simulation_name, simulator.metrics, replicates,
+                                        sim_settings.steps + 1)
+        simulator.simulate(store=store, replicate=replicate)
+    store.flush()
+
+    return store
+
+
+def comparison_table(aggregates, metric, epoch=None):
+    """Return a text table comparing a metric at a given epoch across aggregated simulations.
+
+    Parameters
+    ----------
+    aggregates : list
+        Aggregate objects of the simulations to compare.
+    metric : str
+        Name of the metric to compare.
+    epoch : int
+        Epoch at which the metric is compared. By default, the last one reached by every replicate of each
+        simulation."""
+
+    header = '{:<24}{:>10}{:>14}{:>14}'.format('SIMULATION', 'RUNS', 'MEAN', 'STD')
+    header += ''.join('{:>14}'.format('Q{:g}'.format(q)) for q in aggregates[0].quantiles)
+    rows = [header]
+    for agg in aggregates:
+        i = agg.index(metric)
+        e = epoch if epoch is not None else max(np.flatnonzero(agg.count == agg.count.max()), default=0)
+        row = '{:<24}{:>10}{:>14.4f}{:>14.4f}'.format(agg.name, agg.count[e], agg.mean[e, i], np.sqrt(agg.var[e, i]))
+        row += ''.join('{:>14.4f}'.format(band[e, i]) for band in agg.bands)
+        rows.append(row)
+
+    return '\n'.join(rows)
@@ -0,0 +1,321 @@
+"""Adaptive search of the parameter values at which the outcome of a simulation flips, e.g. the payoff or the
+abundance at which the altruistic allele goes from extinction to dominance.
+
+Runs are jobs as in distributed.py (a configuration as read by the command line plus an id and a seed) whose
+settings are overridden by the searched parameters, so any simulator the command line knows can be searched. A
+run succeeds if a metric ends at or above a threshold. Outcomes are random, so each probed point gets replicates
+in batches only until a confidence interval of its chance of success excludes one half, or up to a maximum: runs
+are spent where outcomes are uncertain and nowhere else.
+
+    search = ThresholdSearch(config)
+    threshold = search.bisect('both_altruistic_chance', 0, 1, tolerance=0.02)
+    surrogate = search.surrogate_search({'both_altruistic_chance': (0, 1), 'abundance': (0.5, 3)})
+"""
+
+import copy
+import inspect
+import numpy as np
+from wallawin.src.cli import SIMULATORS
+from wallawin.src.distributed import run_job, read_blob
+
+# Settings counting things, searched over integers.
+INTEGER_SETTINGS = ('steps', 'pop_size', 'runs', 'base_longevity', 'carrying_capacity', 'memory_budget',
+                    'competition_ticks')
+
+
+def run_locally(job):
+    """Run a job in this process and return its per-epoch metrics array and the metric names."""
+
+    return read_blob(run_job(job))[:2]
+
+
+def parameter_value(parameter, value):
+    """Return the value a parameter is set to: the nearest integer for settings counting things (INTEGER_SETTINGS),
+    a float for any other."""
+
+    if parameter.split('.')[0] in INTEGER_SETTINGS:
+        return int(round(value))
+    return float(value)
+
+
+def set_parameter(config, parameter, value):
+    """Set a setting of a configuration to parameter_value(parameter, value). Entries of list settings are given
+    by dotted paths, e.g. 'alt_and_selfish_chance.0' or 'payoff.1.0'. Settings the configuration leaves out start
+    from the default of its settings class."""
+
+    keys = parameter.split('.')
+    settings = config['settings']
+    if keys[0] not in settings:
+        default = inspect.signature(SIMULATORS[config['simulator']][1]).parameters.get(keys[0])
+        if default is None or default.default is inspect.Parameter.empty:
+            raise KeyError('{} has no setting {} with a default.'.format(config['simulator'], keys[0]))
+        settings[keys[0]] = copy.deepcopy(default.default)
+
+    target = settings
+    for key in keys[:-1]:
+        target = target[key] if isinstance(target, dict) else target[int(key)]
+    target[keys[-1] if isinstance(target, dict) else int(keys[-1])] = parameter_value(parameter, value)
+
+
+def wilson_interval(successes, trials, z=1.96):
+    """Return the Wilson score interval of a chance of success."""
+
+    if trials == 0:
+        return 0.0, 1.0
+    share = successes / trials
+    center = (share + z ** 2 / (2 * trials)) / (1 + z ** 2 / trials)
+    spread = z / (1 + z ** 2 / trials) * np.sqrt(share * (1 - share) / trials + z ** 2 / (4 * trials ** 2))
+    return max(0.0, center - spread), min(1.0, center + spread)
+
+
+class Probe:
+    """Outcomes of the runs of a point of the parameter space.
+
+    Attributes
+    ----------
+    point : dict
+        Mapping of each parameter to its value.
+    successes : int
+        Runs that succeeded.
+    trials : int
+        Runs.
+    """
+
+    def __init__(self, point):
+        self.point = point
+        self.successes = 0
+        self.trials = 0
+
+    @property
+    def share(self):
+        return self.successes / self.trials if self.trials else np.nan
+
+    def decided(self, z):
+        """Whether the chance of success is known to be above or below one half."""
+
+        low, high = wilson_interval(self.successes, self.trials, z)
+        return low > 0.5 or high < 0.5
+
+    def __repr__(self):
+        return 'Probe({}, {}/{})'.format(self.point, self.successes, self.trials)
+
+
+class LogisticSurrogate:
+    """Logistic regression of the chance of success on quadratic features of the parameters, scaled to the unit
+    box given by their bounds. Cheap to fit and evaluate, so it can be queried on many candidate points.
+
+    Attributes
+    ----------
+    parameters : list
+        Names of the parameters.
+    bounds : array
+        Lower and upper bound of each parameter, shape (parameters, 2).
+    coefficients : array
+        Fitted coefficients of the features.
+    """
+
+    def __init__(self, parameters, bounds, ridge=1e-2):
+        self.parameters = list(parameters)
+        self.bounds = np.array(bounds, dtype=np.float64)
+        self.ridge = ridge
+        self.coefficients = None
+
+    def scale(self, values):
+        return (np.atleast_2d(values) - self.bounds[:, 0]) / (self.bounds[:, 1] - self.bounds[:, 0])
+
+    def features(self, x):
+        d = x.shape[1]
+        columns = [np.ones(len(x))] + [x[:, i] for i in range(d)]
+        columns += [x[:, i] * x[:, j] for i in range(d) for j in range(i, d)]
+        return np.column_stack(columns)
+
+    def fit(self, values, successes, trials):
+        """Fit the model by iteratively reweighted least squares, penalizing large coefficients so perfectly
+        separated outcomes still give a finite fit."""
+
+        phi = self.features(self.scale(values))
+        successes, trials = np.asarray(successes, dtype=np.float64), np.asarray(trials, dtype=np.float64)
+        w = np.zeros(phi.shape[1])
+        for iteration in range(100):
+            p = 1 / (1 + np.exp(-phi @ w))
+            gradient = phi.T @ (successes - trials * p) - self.ridge * w
+            hessian = (phi * (trials * p * (1 - p))[:, None]).T @ phi + self.ridge * np.eye(len(w))
+            step = np.linalg.solve(hessian, gradient)
+            w += step
+            if np.abs(step).max() < 1e-8:
+                break
+        self.coefficients = w
+        return self
+
+    def probability(self, values):
+        """Return the chance of success predicted for each row of values (one column per parameter)."""
+
+        return 1 / (1 + np.exp(-self.features(self.scale(values)) @ self.coefficients))
+
+
+class ThresholdSearch:
+    """Finds where the outcome of a simulation flips as its parameters change.
+
+    Attributes
+    ----------
+    config : dict
+        Configuration of the simulation, as read by the command line.
+    metric : str
+        Metric whose last recorded value decides a run's outcome. By default the altruistic population percentage
+        of simulators that have one; other simulators (e.g. PayoffGame) must name theirs.
+    threshold : float
+        A run succeeds if its metric ends at or above it.
+    batch : int
+        Replicates added at a time to an undecided point.
+    max_replicates : int
+        Replicates after which a point is left undecided, i.e. taken as lying on the threshold.
+    z : float
+        Standard score of the confidence intervals of the chances of success.
+    equilibrium : bool
+        Whether runs stop as soon as an equilibrium, fixation or extinction is reached.
+    runner : function
+        Takes a job and returns its per-epoch metrics array and metric names. Runs locally by default; any
+        other way of running jobs (e.g. a work queue) may be plugged in.
+    probes : list
+        Every point probed so far.
+    runs : int
+        Simulations run so far.
+    """
+
+    def __init__(self, config, metric=None, threshold=0.5, batch=4, max_replicates=32,
+                 z=1.96, equilibrium=True, seed=0, runner=run_locally):
+        self.config = config
+        self.metric = metric or 'Altruistic Population Percentage'
+        self.threshold = threshold
+        self.batch = batch
+        self.max_replicates = max_replicates
+        self.z = z
+        self.equilibrium = equilibrium
+        self.seed = seed
+        self.runner = runner
+        self.probes = []
+        self.runs = 0
+
+    def job(self, point):
+        job = copy.deepcopy(self.config)
+        for parameter, value in point.items():
+            set_parameter(job, parameter, value)
+        job.update(id='search_{:06d}'.format(self.runs), seed=self.seed + self.runs, equilibrium=self.equilibrium)
+        self.runs += 1
+        return job
+
+    def outcome(self, point):
+        """Run a simulation at point and return whether it succeeded."""
+
+        data, metrics = self.runner(self.job(point))
+        if self.metric not in metrics:
+            raise ValueError('{} is not a metric of {}, choose one of {}.'.format(self.metric, self.config['simulator'],
+                                                                                 metrics))
+        reached = data[~np.isnan(data).all(axis=1)]
+        return bool(len(reached)) and reached[-1, metrics.index(self.metric)] >= self.threshold
+
+    def probe(self, point):
+        """Run replicates at point until its chance of success is known to be above or below one half, or
+        max_replicates runs. Return its Probe.
+
+        Parameters
+        ----------
+        point : dict
+            Mapping of each parameter to its value. The probe holds the values the parameters are actually set
+            to, e.g. rounded for integer settings."""
+
+        point = {parameter: parameter_value(parameter, value) for parameter, value in point.items()}
+        probe = Probe(point)
+        self.probes.append(probe)
+        while probe.trials < self.max_replicates and not probe.decided(self.z):
+            for replicate in range(min(self.batch, self.max_replicates - probe.trials)):
+                probe.successes += self.outcome(point)
+                probe.trials += 1
+
+        return probe
+
+    def bisect(self, parameter, low, high, tolerance):
+        """Find the value of a single parameter at which the chance of success crosses one half, assuming it
+        changes monotonically between low and high.
+
+        Parameters
+        ----------
+        parameter : str
+            Name of the setting (or dotted path into a list setting).
+        low, high : float
+            Bounds of the search. Their outcomes must differ.
+        tolerance : float
+            Width of the final bracket.
+
+        Returns
+        -------
+        float
+            The estimated threshold: the middle of the final bracket, or the first point whose outcome stayed
+            undecided after max_replicates runs."""
+
+        low_probe, high_probe = self.probe({parameter: low}), self.probe({parameter: high})
+        low_success, high_success = low_probe.share > 0.5, high_probe.share > 0.5
+        if low_success == high_success:
+            raise ValueError('The outcome does not flip between {} = {} and {} ({:.2f} and {:.2f} successes).'
+                             .format(parameter, low, high, low_probe.share, high_probe.share))
+
+        while high - low > tolerance:
+            middle = (low + high) / 2
+            probe = self.probe({parameter: middle})
+            if not probe.decided(self.z):
+                return middle
+            if (probe.share > 0.5) == low_success:
+                low = middle
+            else:
+                high = middle
+
+        return (low + high) / 2
+
+    def surrogate_search(self, bounds, points=30, initial=None, candidates=2000, rng=None):
+        """Map where the chance of success crosses one half over several parameters. A logistic surrogate fitted
+        to every probe so far picks each next point among random candidates, favouring those it is most unsure
+        about and far from the points already probed. As everywhere, points far from the boundary are settled by
+        a single batch of replicates and only those near it get more.
+
+        Parameters
+        ----------
+        bounds : dict
+            Mapping of each parameter to its (low, high) bounds.
+        points : int
+            Number of points to probe.
+        initial : int
+            Points spread over the whole box (a Latin hypercube) before the surrogate picks any. 2 ** parameters
+            + 2 by default.
+        candidates : int
+            Random candidate points the surrogate scores to choose each next one.
+        rng : numpy.random.Generator
+            Source of the candidate points.
+
+        Returns
+        -------
+        LogisticSurrogate
+            The surrogate fitted to every probe. Its probability method predicts the chance of success anywhere."""
+
+        rng = rng or np.random.default_rng(self.seed)
+        parameters = list(bounds)
+        surrogate = LogisticSurrogate(parameters, [bounds[parameter] for parameter in parameters])
+        low, high = surrogate.bounds[:, 0], surrogate.bounds[:, 1]
+        d = len(parameters)
+        initial = min(points, initial or 2 ** d + 2)
+
+        strata = np.array([rng.permutation(initial) for parameter in parameters]).T
+        for row in (strata + rng.random((initial, d))) / initial:
+            self.probe(dict(zip(parameters, (low + row * (high - low)).tolist())))
+
+        probes = list(self.probes[-initial:])
+        while True:
+            values = np.array([[probe.point[parameter] for parameter in parameters] for probe in probes])
+            surrogate.fit(values, [probe.successes for probe in probes], [probe.trials for probe in probes])
+            if len(probes) == points:
+                return surrogate
+
+            x = rng.random((candidates, d))
+            p = surrogate.probability(low + x * (high - low))
+            distance = np.sqrt(((x[:, None, :] - surrogate.scale(values)[None, :, :]) ** 2).sum(axis=2)).min(axis=1)
+            best = np.argmax(p * (1 - p) * distance)
+            probes.append(self.probe(dict(zip(parameters, (low + x[best] * (high - low)).tolist()))))
@@ -6,6 +6,10 @@ PLOT_SETTINGS = {'PLOT': False,
                  'Y_MIN': 0.0,
                  'Y_MAX': 100.0}
 
+# BACKEND is either 'python' or 'numba'. The latter runs the sequential phases of the simulations on compiled
+# kernels (see kernels.py) and falls back to 'python' if Numba is not installed.
+KERNEL_SETTINGS = {'BACKEND': 'python'}
+
 
 class SimSettings:
     """
@@ -50,13 +54,26 @@ class SimSettings:
     env_size_y : int
         Vertical length of the 2D space in which the simulation is carried. Only relevant in simulations
         that involve movement.
+    carrying_capacity : int
+        Population the environment can sustain, or None for no limit. How it is enforced depends on regulation.
+    regulation : str
+        'logistic' to damp the chance of reproduction by a factor 1 - N/carrying_capacity, where N is the
+        population at the start of the selection, or 'cull' to kill random organisms once the population exceeds
+        the carrying capacity.
+    memory_budget : int
+        Maximum number of organisms held in memory, or None for no limit. Larger populations are subsampled
+        uniformly down to it, and each organism left stands for several (see the simulator's weight).
+    competition_ticks : int
+        Relevant on simulations with movement. Maximum number of ticks (moves towards the food) the competition
+        for food of each epoch lasts.
     """
 
     def __init__(self, steps, pop_size, abundance, rep_factor, simulation_name, runs=1, mutation_chance=10,
                  mutability=1.2,
                  feading_range=10,
                  base_longevity=400000, risk=0, starvation=True, static_food_generation=True,
-                 env_size_x=100, env_size_y=100):
+                 env_size_x=100, env_size_y=100, carrying_capacity=None, regulation='logistic', memory_budget=None,
+                 competition_ticks=100):
         self.steps = steps
         self.pop_size = pop_size
         self.abundance = abundance
@@ -72,6 +89,10 @@ class SimSettings:
         self.env_size_x = env_size_x
         self.env_size_y = env_size_y
         self.simulation_name = simulation_name
+        self.carrying_capacity = carrying_capacity
+        self.regulation = regulation
+        self.memory_budget = memory_budget
+        self.competition_ticks = competition_ticks
 
     def __str__(self):
 
@@ -90,6 +111,7 @@ class SimSettings:
         STATIC FOOD GENERATION : {}
         STARVATION : {}        
         RISK : {}
+        CARRYING CAPACITY : {} ({})
 
         REPRODUCTIVE SETTINGS 
         
@@ -100,9 +122,12 @@ class SimSettings:
         OTHERS
         
         FEADING RANGE : {}
+        COMPETITION TICKS : {}
+        MEMORY BUDGET : {}
         """.format(self.steps, self.pop_size, self.runs, self.env_size_x, self.env_size_y, self.abundance,
-                   self.base_longevity, self.static_food_generation, self.starvation, self.risk, self.rep_factor,
-                   self.mutation_chance, self.mutability, self.feading_range)
+                   self.base_longevity, self.static_food_generation, self.starvation, self.risk,
+                   self.carrying_capacity, self.regulation, self.rep_factor, self.mutation_chance, self.mutability,
+                   self.feading_range, self.competition_ticks, self.memory_budget)
 
         return string
 
@@ -158,6 +183,14 @@ class DoveHawkSettings(SimSettings):
         alt_and_selfish_chance : list
             A list l containing two floats such that, when an altruistic organism competes with a selfish one,
             l[0] is the chance of reproduction of the first and l[1] that of the second.
+        carrying_capacity : int
+            Population the environment can sustain, or None for no limit.
+        regulation : str
+            'logistic' (reproduction damping) or 'cull' (random culling), enforcing the carrying capacity.
+        memory_budget : int
+            Maximum number of organisms held in memory, or None for no limit.
+        competition_ticks : int
+            Maximum number of ticks the competition for food of each epoch lasts.
         """
 
     def __init__(self, steps, pop_size, abundance, rep_factor, simulation_name, runs=1, mutation_chance=10,
@@ -165,14 +198,26 @@ class DoveHawkSettings(SimSettings):
                  feading_range=10,
                  base_longevity=400000, risk=0, starvation=True, static_food_generation=True,
                  env_size_x=100, env_size_y=100, both_altruistic_chance=0.5, both_selfish_chance=0.2,
-                 alt_and_selfish_chance=[0.2, 0.8]):
+                 alt_and_selfish_chance=[0.2, 0.8], carrying_capacity=None, regulation='logistic',
+                 memory_budget=None, competition_ticks=100):
         super().__init__(steps, pop_size, abundance, rep_factor, simulation_name, runs, mutation_chance, mutability,
                          feading_range, base_longevity, risk, starvation, static_food_generation,
-                         env_size_x, env_size_y)
+                         env_size_x, env_size_y, carrying_capacity, regulation, memory_budget, competition_ticks)
         self.both_altruistic_chance = both_altruistic_chance
         self.both_selfish_chance = both_selfish_chance
         self.alt_and_selfish_chance = alt_and_selfish_chance
 
+    # Strategies of the 2x2 game played by Dove/Hawk organisms, in the order of the payoff matrix.
+    strategies = ('Selfish', 'Altruistic')
+
+    @property
+    def payoff(self):
+        """Payoff matrix of the Dove/Hawk game: payoff[a][b] is the chance of reproduction of an organism with
+        strategy a competing with one with strategy b."""
+
+        return [[self.both_selfish_chance, self.alt_and_selfish_chance[1]],
+                [self.alt_and_selfish_chance[0], self.both_altruistic_chance]]
+
     def __str__(self):
 
         string = """
@@ -190,6 +235,7 @@ class DoveHawkSettings(SimSettings):
                 STATIC FOOD GENERATION : {}
                 STARVATION : {}        
                 RISK : {}
+                CARRYING CAPACITY : {} ({})
 
                 REPRODUCTIVE SETTINGS 
 
@@ -207,12 +253,51 @@ class DoveHawkSettings(SimSettings):
                 OTHERS
 
                 FEADING RANGE : {}
+                COMPETITION TICKS : {}
+                MEMORY BUDGET : {}
                 """.format(self.steps, self.pop_size, self.runs, self.env_size_x, self.env_size_y, self.abundance,
                            self.base_longevity, self.static_food_generation, self.starvation, self.risk,
-                           self.rep_factor,
+                           self.carrying_capacity, self.regulation, self.rep_factor,
                            self.mutation_chance, self.mutability, self.both_altruistic_chance,
                            self.both_selfish_chance, self.alt_and_selfish_chance[0],
-                           self.alt_and_selfish_chance[1], self.feading_range)
+                           self.alt_and_selfish_chance[1], self.feading_range, self.competition_ticks,
+                           self.memory_budget)
+
+        return string
+
+
+class GameSettings(SimSettings):
+    """
+        Specific class for PayoffGame simulation settings. Besides those of SimSettings it defines the game played
+        by competing organisms.
+
+        Attributes
+        ----------
+        strategies : list
+            Names of the K heritable strategies.
+        payoff : list
+            A KxK matrix such that, when an organism with strategy a competes with one with strategy b, payoff[a][b]
+            is the amount of meals the first gets (i.e., its chance of reproduction with a rep_factor of 100).
+        """
+
+    def __init__(self, steps, pop_size, abundance, rep_factor, simulation_name, strategies, payoff, runs=1,
+                 mutation_chance=10, mutability=1.2, feading_range=10, base_longevity=400000, risk=0, starvation=True,
+                 static_food_generation=True, env_size_x=100, env_size_y=100, carrying_capacity=None,
+                 regulation='logistic', memory_budget=None, competition_ticks=100):
+        super().__init__(steps, pop_size, abundance, rep_factor, simulation_name, runs, mutation_chance, mutability,
+                         feading_range, base_longevity, risk, starvation, static_food_generation,
+                         env_size_x, env_size_y, carrying_capacity, regulation, memory_budget, competition_ticks)
+        self.strategies = strategies
+        self.payoff = payoff
+
+    def __str__(self):
+
+        rows = '\n'.join('        {} : {}'.format(name, row) for name, row in zip(self.strategies, self.payoff))
+        string = super().__str__() + """
+        PAYOFF MATRIX
+        
+{}
+        """.format(rows)
 
         return string
 
@@ -236,14 +321,17 @@ class Traits:
         A factor determining how quickly the energy is released.
         Energy release is always proportionally equivalent to velocity.
         Only relevant in simulations involving movement.
+    strategy : int
+        Index of the organism's strategy in the payoff matrix. Only relevant in PayoffGame simulations.
     """
 
-    def __init__(self, altruistic, longevity, velocity=5, energy=10, energy_release=0.1):
+    def __init__(self, altruistic, longevity, velocity=5, energy=10, energy_release=0.1, strategy=None):
         self.longevity = longevity
         self.velocity = velocity
         self.energy = energy
         self.energy_release = energy_release
         self.altruistic = altruistic
+        self.strategy = strategy
 
 
 TEST = DoveHawkSettings(100, 10, 2, 100, simulation_name="test_1", base_longevity=33, static_food_generation=True)
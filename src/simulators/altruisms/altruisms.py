@@ -10,14 +10,19 @@ class BaseAltruism(BaseSimulator):
 
     def evolve(self):
         """Simulate altruistic behavior and evaluate each organism's fitness.
-        Then reset organism's meals attribute and regenerate food in the environment."""
+        Then reset organism's meals attribute, regulate the population density and regenerate food in the
+        environment."""
 
         self.altruism()
+        self.damping = self.density_damping()
         for org in self.generation.copy():
             org.age += 1
             self.fitness_function(org)
 
+        self.regulate()
         self.food = self.gen_food()
+        if self.lineage is not None:
+            self.lineage.census(self.generation)
 
     def altruism(self):
         """Base altruism method. The child classes will define their particular altruistic simulations
@@ -28,6 +33,11 @@ class BaseAltruism(BaseSimulator):
 class PredictableAltruism(BaseAltruism):
     """Base class for all Simulators centered on altruismtic traits."""
 
+    # Keys of the per-epoch data gathered by get_step_data, in a fixed order (used by results stores).
+    metrics = ('Population Size', 'Average Speed', 'Population Growth Rate', 'Altruistic Population',
+               'Selfish Population', 'Altruistic Population Percentage', 'Selfish Population Percentage',
+               'Altruistic organisms per selfish organism', 'Selfish organisms per altruistic organisms')
+
     def __init__(self, sim_settings, altruistic_org_traits, selfish_org_traits):
         """
         Parameters
@@ -37,7 +47,12 @@ class PredictableAltruism(BaseAltruism):
         """
         self.altruistic_org_traits = altruistic_org_traits
         self.selfish_org_traits = selfish_org_traits
-        super().__init__(sim_settings)
+        super().__init__(sim_settings, None)
+        self.alt_pop = [x for x in self.generation if x.traits.altruistic]
+        self.selfish_pop = [x for x in self.generation if not x.traits.altruistic]
+
+    def restart(self):
+        super().restart()
         self.alt_pop = [x for x in self.generation if x.traits.altruistic]
         self.selfish_pop = [x for x in self.generation if not x.traits.altruistic]
 
@@ -1,7 +1,9 @@
-from altruisms import PredictableAltruism
+from wallawin.src.simulators.altruisms.altruisms import PredictableAltruism
 from random import choice
 from math import dist
 from wallawin.src.data_representation import plot_env, share_or_take_plot, PLOT_SETTINGS
+from wallawin.src import kernels
+import numpy as np
 
 
 class Charity(PredictableAltruism):
@@ -11,16 +13,34 @@ class Charity(PredictableAltruism):
     the survival of another altruistic organisms. Selfish organisms will always keep
     their food for themselves."""
 
-    def __init__(self, sim_settings, alt_org_traits, selfish_org_traits):
+    def __init__(self, sim_settings, alt_org_traits, selfish_org_traits, domains=None):
+        """
+        Parameters
+        ---------
+        domains : DomainEngine
+            If given, run_epoch simulates the competition for food on its worker processes.
+        """
+
         super().__init__(sim_settings, alt_org_traits, selfish_org_traits)
+        self.domains = domains
 
     def altruism(self):
         """Simulates altruistic behavior by making altruistic organisms with
         two meals share one of them with another altruistic organism with zero meals
         if possible."""
 
-        fit_for_sharing = [org for org in self.alt_pop if org.meals >= 2]
-        fit_for_receiving = [org for org in self.alt_pop if org.meals == 0]
+        # The altruistic organisms of the current generation, not only those of the initial one.
+        alt_pop = [org for org in self.generation if org.traits.altruistic]
+        if kernels.enabled():
+            meals = np.array([org.meals for org in alt_pop], dtype=np.float64)
+            pairs = kernels.match_sharers(meals, np.ones(len(alt_pop), dtype=np.bool_),
+                                          np.random.permutation(len(alt_pop)))
+            for sharer, recipient in pairs:
+                alt_pop[sharer].share(alt_pop[recipient])
+            return
+
+        fit_for_sharing = [org for org in alt_pop if org.meals >= 2]
+        fit_for_receiving = [org for org in alt_pop if org.meals == 0]
 
         for org in fit_for_sharing:
             if not fit_for_receiving:
@@ -38,9 +58,14 @@ class Charity(PredictableAltruism):
         Parameters
         ----------
         organisms : list
-            List of organisms to simulate the competition with."""
+            List of organisms to simulate the competition with. Organisms that can't eat any more
+            are removed from it."""
+
+        if kernels.enabled():
+            self.compiled_competition(organisms)
+            return
 
-        for org in organisms:
+        for org in organisms.copy():
             # Check if there's food and org can still eat. In any false case, go to next organism.
             if not self.food or org.meals >= 2:
                 organisms.remove(org)
@@ -54,31 +79,118 @@ class Charity(PredictableAltruism):
             else:
                 org.move_to(nearest_food.pos, effortless=True)
 
-    def simulate(self):
-        """Simulate the evolution process, plot and save the data for as many runs
-        as specified."""
+    def compiled_competition(self, organisms):
+        """Same as sim_competition, run on the compiled claim_food kernel.
+
+        Parameters
+        ----------
+        organisms : list
+            List of organisms to simulate the competition with."""
+
+        if not organisms:
+            return
 
-        for run in range(0, self.settings.runs):
+        pos = np.array([org.pos for org in organisms], dtype=np.float64)
+        meals = np.array([org.meals for org in organisms], dtype=np.float64)
+        velocity = np.array([org.traits.velocity if org.traits.energy > 0 else 0 for org in organisms],
+                            dtype=np.float64)
+        active = np.ones(len(organisms), dtype=np.bool_)
+        food_pos = np.array([food.pos for food in self.food], dtype=np.float64).reshape(-1, 2)
+        food_left = np.ones(len(self.food), dtype=np.bool_)
 
-            step, epoch = 0, 0
-            active_individuals = self.generation.copy()
-            epoch_data = {}
+        kernels.claim_food(pos, meals, velocity, active, food_pos, food_left, self.settings.feading_range)
 
-            while True:
-                step += 1
-                if step > self.settings.steps or len(self.generation) == 0:
-                    share_or_take_plot(epoch_data, run)
-                    self.generation = self.gen_population(self.settings.pop_size) # ?
-                    break
+        for org, org_pos, org_meals in zip(organisms, pos, meals):
+            org.pos = org_pos
+            org.meals = int(org_meals)
+        self.food = [food for food, left in zip(self.food, food_left) if left]
+        organisms[:] = [org for org, still_active in zip(organisms, active) if still_active]
 
-                if PLOT_SETTINGS['PLOT'] is True and step % 5 == 0:
-                    plot_env(self.generation, self.food, step, epoch)
+    def decomposed_competition(self):
+        """Simulate the whole competition for food of an epoch on the domain engine's worker processes."""
 
-                if not active_individuals:
-                    self.evolve()
-                    epoch += 1
-                    active_individuals = self.generation.copy()
-                    self.get_step_data(epoch)
-                    continue
+        organisms = self.generation
+        pos = np.array([org.pos for org in organisms], dtype=np.float64).reshape(-1, 2)
+        meals = np.array([org.meals for org in organisms], dtype=np.float64)
+        velocity = np.array([org.traits.velocity if org.traits.energy > 0 else 0 for org in organisms],
+                            dtype=np.float64)
+        food_pos = np.array([food.pos for food in self.food], dtype=np.float64).reshape(-1, 2)
 
-                self.sim_competition(active_individuals)
\ No newline at end of file
+        food_left = self.domains.compete(pos, meals, velocity, food_pos)
+
+        for org, org_pos, org_meals in zip(organisms, pos, meals):
+            org.pos = org_pos
+            org.meals = int(org_meals)
+        self.food = [food for food, left in zip(self.food, food_left) if left]
+
+    def run_epoch(self, epoch):
+        """Simulate a single epoch: competition until no organism can eat any more (or for at most
+        settings.competition_ticks ticks), then altruism, selection and data gathering. The competition runs on
+        the domain engine if the simulator has one.
+
+        Parameters
+        ----------
+        epoch : int
+            Current epoch of the simulation."""
+
+        with self.phase('competition'):
+            if self.domains is not None:
+                self.decomposed_competition()
+            else:
+                active_individuals = self.generation.copy()
+                tick = 0
+                while active_individuals and tick < self.settings.competition_ticks:
+                    if PLOT_SETTINGS['PLOT'] is True and tick % 5 == 0:
+                        plot_env(self.generation, self.food, tick, epoch)
+                    self.sim_competition(active_individuals)
+                    tick += 1
+
+        with self.phase('selection'):
+            self.evolve()
+        with self.phase('data'):
+            self.get_step_data(epoch)
+
+    def simulate(self, store=None, replicate=0, detector=None):
+        """Simulate the evolution process for settings.steps epochs or until the population goes extinct, plot
+        and save the data for as many runs as specified. If the simulator has a domain engine, its workers are
+        stopped once the runs end.
+
+        Parameters
+        ----------
+        store : ResultsStore
+            If given, the data of each epoch is recorded on it instead of plotted at the end of the run. Stores
+            hold a row per replicate, so a single run is simulated (as the given replicate) whatever
+            settings.runs is. Runs that settle or go extinct early have their last epoch carried forward.
+        replicate : int
+            Index of the store's replicate the run is recorded as.
+        detector : EquilibriumDetector
+            If given, each run stops as soon as the detector finds an equilibrium, fixation or extinction,
+            which is recorded in the equilibria dictionary."""
+
+        runs = 1 if store is not None else self.settings.runs
+        try:
+            for run in range(0, runs):
+                if run > 0:
+                    self.restart()
+                if detector is not None:
+                    detector.reset()
+
+                for epoch in range(self.settings.steps + 1):
+                    if not self.generation:
+                        break
+                    self.run_epoch(epoch)
+                    if store is not None:
+                        store.record(replicate + run, epoch, self.data[epoch])
+                    if self.telemetry is not None:
+                        self.telemetry.publish(replicate + run, epoch, self.data[epoch])
+                    if detector is not None and detector.update(epoch, self.data[epoch]):
+                        self.equilibria[run] = detector.summary()
+                        break
+
+                if store is not None:
+                    store.fill(replicate + run)
+                else:
+                    share_or_take_plot(self.data, self.settings.simulation_name)
+        finally:
+            if self.domains is not None:
+                self.domains.close()
@@ -4,6 +4,8 @@ from wallawin.src.data_representation import share_or_take_plot
 from collections import defaultdict
 from random import sample, choice
 from wallawin.src.settings import DoveHawkSettings, Traits
+from wallawin.src import kernels
+import numpy as np
 
 
 class PredictableDoveOrHawk(PredictableAltruism):
@@ -34,6 +36,11 @@ class PredictableDoveOrHawk(PredictableAltruism):
         hasn't been chosen by more than one other organism. These creates the possibility that an organism may chose a
         food particle already picked by another, with eventual altruistic/selfish resolutions of the conflict."""
 
+        self.chosen_food = defaultdict(list)
+        if kernels.enabled():
+            self.compiled_competition()
+            return
+
         for org in sample(self.generation, len(self.generation)):
             # Chose a random food particle that hasn't been chosen by more than one other organism.
             available_food = [food for food in self.food if len(self.chosen_food[food]) < 2]
@@ -42,6 +49,16 @@ class PredictableDoveOrHawk(PredictableAltruism):
             food = choice(available_food)
             self.chosen_food[food].append(org)
 
+    def compiled_competition(self):
+        """Run competition and altruism at once on the compiled resolve_pairs kernel, setting the meals of every
+        organism. Leaves chosen_food empty, so altruism has nothing left to resolve."""
+
+        payoff = np.array(self.settings.payoff, dtype=np.float64)
+        strategy = np.array([int(org.traits.altruistic) for org in self.generation], dtype=np.int64)
+        meals = kernels.resolve_pairs(strategy, np.random.permutation(len(self.generation)), len(self.food), payoff)
+        for org, org_meals in zip(self.generation, meals):
+            org.meals = org_meals
+
     def altruism(self):
         """Simulates altruistic/selfish behavior by determining whether competing pairs should share, take or fight
         for the food, according to the altruistic gen. Three possible cases:
@@ -52,8 +69,11 @@ class PredictableDoveOrHawk(PredictableAltruism):
             The selfish individuals takes all the food with high chance of reproduction. Altruistic eats the spoils with
             very low chance of reproduction.
         Both individuals are selfish:
-            The individuals will fight for the food with tremendous cost of energy. Very low chance of reproduction."""
+            The individuals will fight for the food with tremendous cost of energy. Very low chance of reproduction.
+
+        The chances of each case are looked up on the settings' payoff matrix, indexed by the altruistic gen."""
 
+        payoff = self.settings.payoff
         for orgs in self.chosen_food.values():
             if len(orgs) == 0:
                 continue
@@ -61,42 +81,72 @@ class PredictableDoveOrHawk(PredictableAltruism):
                 orgs[0].meals += 1
                 continue
 
-            altruism_a = orgs[0].traits.altruistic
-            altruism_b = orgs[1].traits.altruistic
+            altruism_a = int(orgs[0].traits.altruistic)
+            altruism_b = int(orgs[1].traits.altruistic)
+            orgs[0].meals = payoff[altruism_a][altruism_b]
+            orgs[1].meals = payoff[altruism_b][altruism_a]
+
+    def run_epoch(self, epoch):
+        """Simulate a single epoch: competition, altruism, selection and data gathering.
+
+        Parameters
+        ----------
+        epoch : int
+            Current epoch of the simulation."""
 
-            if altruism_a and altruism_b:
-                orgs[0].meals = orgs[1].meals = self.settings.both_altruistic_chance
-            elif not altruism_a and not altruism_b:
-                orgs[0].meals = orgs[1].meals = self.settings.both_selfish_chance
-            else:
-                selfish = orgs[1] if altruism_a else orgs[0]
-                altruistic = orgs[1] if selfish is orgs[0] else orgs[0]
-                selfish.meals = self.settings.alt_and_selfish_chance[1]
-                altruistic.meals = self.settings.alt_and_selfish_chance[0]
+        with self.phase('competition'):
+            self.sim_competition()
+        with self.phase('selection'):
+            self.evolve()
+        with self.phase('data'):
+            self.get_step_data(epoch)
 
-    def simulate(self, runs=1):
+    def simulate(self, runs=1, store=None, replicate=0, detector=None, verbose=False):
         """Simulate the evolution process, plot and save the data for as many runs as specified.
 
         Parameters
         ----------
         runs : int
-            Number of times the simulation will be run. Set to 1 by default."""
+            Number of times the simulation will be run. Set to 1 by default.
+        store : ResultsStore
+            If given, the data of each epoch is recorded on it instead of plotted at the end of the run. Runs
+            that settle or go extinct early have their last epoch carried forward.
+        replicate : int
+            Index of the store's replicate the first run is recorded as. Following runs take the next ones.
+        detector : EquilibriumDetector
+            If given, each run stops as soon as the detector finds an equilibrium, fixation or extinction,
+            which is recorded in the equilibria dictionary.
+        verbose : bool
+            Whether to print the population of each epoch."""
 
         for run in range(0, runs):
+            if run > 0:
+                self.restart()
 
-            epoch = 0
+            epoch, settled = 0, False
+            if detector is not None:
+                detector.reset()
 
             while True:
 
-                if epoch > self.settings.steps or len(self.generation) == 0:
-                    share_or_take_plot(self.data, self.settings.simulation_name)
+                if settled or epoch > self.settings.steps or len(self.generation) == 0:
+                    if store is None:
+                        share_or_take_plot(self.data, self.settings.simulation_name)
+                    else:
+                        store.fill(replicate + run)
                     break
 
-                self.sim_competition()
-                self.evolve()
-                self.get_step_data(epoch)
-                print("Epoch : ", epoch, " ------- Pop Size : ", len(self.generation),
-                      ' ------- ', self.data[epoch]['Selfish Population Percentage'])
+                self.run_epoch(epoch)
+                if store is not None:
+                    store.record(replicate + run, epoch, self.data[epoch])
+                if detector is not None and detector.update(epoch, self.data[epoch]):
+                    self.equilibria[run] = detector.summary()
+                    settled = True
+                if self.telemetry is not None:
+                    self.telemetry.publish(replicate + run, epoch, self.data[epoch])
+                if verbose:
+                    print("Epoch : ", epoch, " ------- Pop Size : ", len(self.generation),
+                          ' ------- ', self.data[epoch]['Selfish Population Percentage'])
                 epoch += 1
 
 
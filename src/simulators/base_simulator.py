@@ -1,9 +1,12 @@
 """Defines all classes and functionality regarding to environmental simulation.
 It's where the magic happens."""
 
-from random import uniform, randint
+from random import uniform, randint, sample
 from math import floor
 from wallawin.src.data_representation import save_simulation_settings
+from wallawin.src.lineage import LineageRecorder
+from wallawin.src.telemetry import Telemetry
+from contextlib import nullcontext
 import os
 import copy
 import numpy as np
@@ -39,6 +42,12 @@ class BaseSimulator:
         self.generation = self.gen_population(sim_settings.pop_size)
         self.food = self.gen_food()
         self.data = {}
+        self.equilibria = {}
+        self.lineage = None
+        self.telemetry = None
+        self.damping = 1
+        self.weight = 1
+        self.weights = []
 
         save_simulation_settings(self.settings, self.settings.simulation_name)
 
@@ -57,6 +66,85 @@ class BaseSimulator:
 
         return food
 
+    def track_lineage(self, simplify_interval=50):
+        """Start recording the genealogy of the simulation from the current generation, taken as founders.
+        Return the LineageRecorder holding it, also kept in the lineage attribute.
+
+        Parameters
+        ----------
+        simplify_interval : int
+            Epochs between simplifications of the genealogy."""
+
+        self.lineage = LineageRecorder(simplify_interval)
+        self.lineage.found(self.generation)
+        return self.lineage
+
+    def restart(self):
+        """Start a new run: generate a new population and its food and forget the data of the previous run and
+        the weight of the organisms. If the genealogy is tracked, a new recorder founded on the new population
+        replaces the lineage one."""
+
+        self.generation = self.gen_population(self.settings.pop_size)
+        self.food = self.gen_food()
+        self.data = {}
+        self.weight = 1
+        if self.lineage is not None:
+            self.track_lineage(self.lineage.simplify_interval)
+
+    def monitor(self, interval=0.5):
+        """Start publishing the live metrics of the simulation, readable with the telemetry viewer. Return the
+        Telemetry publishing them, also kept in the telemetry attribute. Its finish method tells viewers the
+        simulation ended.
+
+        Parameters
+        ----------
+        interval : float
+            Minimum seconds between snapshots."""
+
+        self.telemetry = Telemetry(self.settings.simulation_name, interval)
+        return self.telemetry
+
+    def phase(self, name):
+        """Context timing a phase of the epoch if the simulation is monitored."""
+
+        return self.telemetry.phase(name) if self.telemetry is not None else nullcontext()
+
+    def density_damping(self):
+        """Return the factor of the chances of reproduction given the density of the population: 1 - N/K under
+        logistic regulation with a carrying capacity K, 1 otherwise."""
+
+        capacity = self.settings.carrying_capacity
+        if capacity is None or self.settings.regulation != 'logistic':
+            return 1
+        return max(0, 1 - len(self.generation) / capacity)
+
+    def regulate(self):
+        """Kill random organisms down to the carrying capacity under culling regulation, then subsample the
+        population uniformly down to the memory budget if it exceeds it. Subsampling leaves allele frequencies
+        unbiased; each organism left stands for weight organisms, recorded in weights once per epoch. Organisms
+        dropped by subsampling are recorded as dead by the lineage, which only follows the simulated ones."""
+
+        settings = self.settings
+        if settings.regulation == 'cull' and settings.carrying_capacity is not None:
+            self.sample(settings.carrying_capacity)
+        if settings.memory_budget is not None and len(self.generation) > settings.memory_budget:
+            self.weight *= len(self.generation) / settings.memory_budget
+            self.sample(settings.memory_budget)
+        self.weights.append(self.weight)
+
+    def sample(self, size):
+        """Keep a uniform random sample of size organisms of the generation, in their order."""
+
+        n = len(self.generation)
+        if n <= size:
+            return
+        kept = set(sample(range(n), size))
+        if self.lineage is not None:
+            for index in range(n):
+                if index not in kept:
+                    self.lineage.record_death(self.generation[index])
+        self.generation = [self.generation[index] for index in sorted(kept)]
+
     def gen_population(self, size):
         """Base method for population generation."""
         pass
@@ -74,6 +162,8 @@ class BaseSimulator:
             The organism to be deleted of the current generation."""
 
         self.generation.remove(org)
+        if self.lineage is not None:
+            self.lineage.record_death(org)
         del org
 
     def fitness_function(self, org):
@@ -89,11 +179,13 @@ class BaseSimulator:
             self.kill(org)
             return
 
-        rep_chance = org.meals * self.settings.rep_factor
+        rep_chance = org.meals * self.settings.rep_factor * self.damping
         if randint(0, 100) <= rep_chance:
             chiral = copy.deepcopy(org)
             chiral.pos = np.array([uniform(0, self.settings.env_size_x), uniform(0, self.settings.env_size_y)])
             chiral.age = 0
+            if self.lineage is not None:
+                self.lineage.record_birth(chiral, org)
             if randint(0, 100) <= self.settings.mutation_chance:
                 chiral.mutate()
             self.generation.append(chiral)
@@ -0,0 +1,255 @@
+"""Spatial domain decomposition of the competition for food in simulations with movement.
+
+The environment is split into vertical strips, each owned by a worker process. Positions, meals and food
+live in shared memory arrays. On every tick each worker moves the active organisms standing on its strip
+towards the nearest food within its strip plus a halo of feading_range width on each side (read in place
+from the shared food array), and hands organisms crossing a boundary to the neighbouring strip by updating
+their owner. Claims on a food particle are resolved by the worker owning the strip the food lies on, the
+lowest organism index winning, so no two workers ever write the same entry.
+
+Unlike the sequential competition all organisms move at once on each tick, which is what allows strips to
+advance in parallel."""
+
+import multiprocessing
+from threading import BrokenBarrierError
+import numpy as np
+from wallawin.src.exc import SimulationError
+
+# Indexes of the header array shared with the workers.
+ORGS, FOOD, COMMAND = 0, 1, 2
+RUN, STOP = 0, 1
+# Organisms whose distances to the food are computed at once.
+CHUNK = 1024
+
+
+class SharedState:
+    """Shared memory arrays describing the competition, with room for capacity organisms and food_capacity
+    food particles."""
+
+    def __init__(self, workers, capacity, food_capacity):
+        self.capacity = capacity
+        self.food_capacity = food_capacity
+        self.raw = {'header': multiprocessing.RawArray('q', 3),
+                    'pos': multiprocessing.RawArray('d', capacity * 2),
+                    'meals': multiprocessing.RawArray('d', capacity),
+                    'velocity': multiprocessing.RawArray('d', capacity),
+                    'active': multiprocessing.RawArray('b', capacity),
+                    'owner': multiprocessing.RawArray('q', capacity),
+                    'target': multiprocessing.RawArray('q', capacity),
+                    'food_pos': multiprocessing.RawArray('d', food_capacity * 2),
+                    'food_left': multiprocessing.RawArray('b', food_capacity),
+                    'active_count': multiprocessing.RawArray('q', 2 * workers)}
+
+    def views(self):
+        """Return numpy views of every array. Must be called in the process that uses them."""
+
+        raw = self.raw
+        return {'header': np.frombuffer(raw['header'], dtype=np.int64),
+                'pos': np.frombuffer(raw['pos']).reshape(self.capacity, 2),
+                'meals': np.frombuffer(raw['meals']),
+                'velocity': np.frombuffer(raw['velocity']),
+                'active': np.frombuffer(raw['active'], dtype=np.int8),
+                'owner': np.frombuffer(raw['owner'], dtype=np.int64),
+                'target': np.frombuffer(raw['target'], dtype=np.int64),
+                'food_pos': np.frombuffer(raw['food_pos']).reshape(self.food_capacity, 2),
+                'food_left': np.frombuffer(raw['food_left'], dtype=np.int8),
+                'active_count': np.frombuffer(raw['active_count'], dtype=np.int64).reshape(2, -1)}
+
+
+def strip_of(x, width, workers):
+    return np.clip((x // width).astype(np.int64), 0, workers - 1)
+
+
+def move_and_claim(w, state, width, workers, feading_range):
+    """First phase of a tick: move the active organisms of strip w, or make them claim the food they reached.
+    Return the indexes of the organisms of the strip still active. Claims of the previous tick are withdrawn
+    here, as no worker reads them during this phase."""
+
+    n, m = state['header'][ORGS], state['header'][FOOD]
+    pos, meals, active, owner = state['pos'], state['meals'], state['active'], state['owner']
+    food_pos, food_left = state['food_pos'][:m], state['food_left'][:m].astype(bool)
+
+    members = np.flatnonzero((owner[:n] == w) & (active[:n] == 1))
+    state['target'][members] = -1
+    full = meals[members] >= 2
+    active[members[full]] = 0
+    members = members[~full]
+    if not food_left.any():
+        active[members] = 0
+        return members[:0]
+
+    low, high = w * width - feading_range, (w + 1) * width + feading_range
+    window = np.flatnonzero(food_left & (food_pos[:, 0] >= low) & (food_pos[:, 0] < high))
+    everywhere = np.flatnonzero(food_left)
+
+    for start in range(0, len(members), CHUNK):
+        chunk = members[start:start + CHUNK]
+        # Organisms with no food around their strip look for it anywhere.
+        candidates = window if window.size else everywhere
+        d2 = ((pos[chunk, None, :] - food_pos[None, candidates, :]) ** 2).sum(axis=2)
+        nearest = candidates[d2.argmin(axis=1)]
+        distance = np.sqrt(d2.min(axis=1))
+
+        eating = distance < feading_range
+        state['target'][chunk[eating]] = nearest[eating]
+
+        moving, nearest, distance = chunk[~eating], nearest[~eating], distance[~eating]
+        ratio = (state['velocity'][moving] / distance)[:, None]
+        pos[moving] += ratio * (food_pos[nearest] - pos[moving])
+
+    return members
+
+
+def resolve_claims(w, state, width, workers, members):
+    """Second phase of a tick: give each food particle lying on strip w to the lowest indexed organism that
+    claimed it and hand the organisms of the strip that crossed a boundary to their new strip. Owners are only
+    updated here, when no worker is looking for its members. Claims are only read here, every worker reading
+    all of them, so they are withdrawn on the next first phase rather than once resolved."""
+
+    state['owner'][members] = strip_of(state['pos'][members, 0], width, workers)
+
+    n = state['header'][ORGS]
+    target, food_pos = state['target'], state['food_pos']
+
+    claimants = np.flatnonzero(target[:n] >= 0)
+    claimed = target[claimants]
+    own = strip_of(food_pos[claimed, 0], width, workers) == w
+    claimants, claimed = claimants[own], claimed[own]
+
+    order = np.lexsort((claimants, claimed))
+    claimants, claimed = claimants[order], claimed[order]
+    first = np.ones(len(claimed), dtype=bool)
+    first[1:] = claimed[1:] != claimed[:-1]
+    state['meals'][claimants[first]] += 1
+    state['food_left'][claimed[first]] = 0
+
+
+def run_strip(w, shared, workers, width, feading_range, max_ticks, start, done, tick_barrier):
+    """Body of each worker process. Waits for the coordinator to start an epoch's competition, runs ticks
+    until no organism is active anywhere (or max_ticks ticks) and reports it is done."""
+
+    try:
+        state = shared.views()
+        while True:
+            start.wait()
+            if state['header'][COMMAND] == STOP:
+                return
+
+            for tick in range(max_ticks):
+                parity = tick % 2
+                members = move_and_claim(w, state, width, workers, feading_range)
+                state['active_count'][parity, w] = len(members)
+                tick_barrier.wait()
+                resolve_claims(w, state, width, workers, members)
+                tick_barrier.wait()
+                if state['active_count'][parity].sum() == 0:
+                    break
+
+            done.wait()
+    except BaseException:
+        for barrier in (start, done, tick_barrier):
+            barrier.abort()
+        raise
+
+
+class DomainEngine:
+    """Runs the competition for food of a simulation with movement on worker processes, one per strip of the
+    environment. Workers are started on the first competition and reused by the following ones until close
+    is called.
+
+    Attributes
+    ----------
+    sim_settings : SimSettings
+        Settings of the simulation. Gives the environment size, the feading range and the maximum number of
+        ticks of a competition (competition_ticks).
+    workers : int
+        Number of strips (and processes).
+    capacity : int
+        Number of organisms (and of food particles) the shared arrays have room for. Grows as needed.
+    """
+
+    def __init__(self, sim_settings, workers=4, capacity=10000):
+        self.sim_settings = sim_settings
+        self.workers = workers
+        self.capacity = capacity
+        self.shared = None
+        self.processes = []
+
+    def start(self):
+        settings = self.sim_settings
+        self.shared = SharedState(self.workers, self.capacity, self.capacity)
+        self.start_barrier = multiprocessing.Barrier(self.workers + 1)
+        self.done_barrier = multiprocessing.Barrier(self.workers + 1)
+        tick_barrier = multiprocessing.Barrier(self.workers)
+        width = settings.env_size_x / self.workers
+
+        self.processes = [multiprocessing.Process(target=run_strip,
+                                                  args=(w, self.shared, self.workers, width, settings.feading_range,
+                                                        settings.competition_ticks, self.start_barrier,
+                                                        self.done_barrier, tick_barrier), daemon=True)
+                          for w in range(self.workers)]
+        for process in self.processes:
+            process.start()
+        self.state = self.shared.views()
+
+    def close(self):
+        """Stop the worker processes."""
+
+        if not self.processes:
+            return
+        self.state['header'][COMMAND] = STOP
+        try:
+            self.start_barrier.wait()
+        except BrokenBarrierError:
+            pass
+        for process in self.processes:
+            process.join()
+        self.processes = []
+
+    def compete(self, pos, meals, velocity, food_pos):
+        """Run the competition for food until no organism can eat any more.
+
+        Parameters
+        ----------
+        pos : array
+            Positions of the organisms, shape (n, 2). Updated in place.
+        meals : array
+            Meals of the organisms. Updated in place.
+        velocity : array
+            Distance each organism moves per tick.
+        food_pos : array
+            Positions of the food particles, shape (m, 2).
+
+        Returns
+        -------
+        array
+            Boolean mask of the food particles left uneaten."""
+
+        n, m = len(pos), len(food_pos)
+        if max(n, m) > self.capacity:
+            self.close()
+            self.capacity = 2 * max(n, m)
+        if not self.processes:
+            self.start()
+
+        state = self.state
+        state['header'][:] = [n, m, RUN]
+        state['pos'][:n] = pos
+        state['meals'][:n] = meals
+        state['velocity'][:n] = velocity
+        state['active'][:n] = 1
+        state['owner'][:n] = strip_of(pos[:, 0], self.sim_settings.env_size_x / self.workers, self.workers)
+        state['target'][:n] = -1
+        state['food_pos'][:m] = food_pos
+        state['food_left'][:m] = 1
+
+        try:
+            self.start_barrier.wait()
+            self.done_barrier.wait()
+        except BrokenBarrierError:
+            self.processes = []
+            raise SimulationError('A worker of simulation {} failed.'.format(self.sim_settings.simulation_name))
+
+        pos[:] = state['pos'][:n]
+        meals[:] = state['meals'][:n]
+        return state['food_left'][:m].astype(bool)
@@ -0,0 +1,265 @@
+"""Ensemble mode: many replicates of a small payoff game simulation advanced together in one process.
+
+The populations of all replicates are held in (replicates, capacity) arrays, with a mask of the slots holding
+living organisms, so each phase of an epoch (competition, resolution of encounters, selection) is a handful of
+whole-array operations for every replicate at once instead of a Python loop per organism and per run."""
+
+import numpy as np
+from math import floor
+
+
+def group_rank(groups):
+    """Return the position of each element among the elements of its group, following their order."""
+
+    order = np.argsort(groups, kind='stable')
+    sorted_groups = groups[order]
+    starts = np.flatnonzero(np.r_[True, sorted_groups[1:] != sorted_groups[:-1]])
+    rank = np.empty(len(groups), dtype=np.int64)
+    rank[order] = np.arange(len(groups)) - np.repeat(starts, np.diff(np.r_[starts, len(groups)]))
+    return rank
+
+
+class EnsembleGame:
+    """Runs R replicates of a PayoffGame simulation at once, following the same rules: organisms pick a random
+    food particle chosen by less than two others, get a meal if alone or the payoff of their strategy against
+    their rival's otherwise, reproduce with chance meals * rep_factor and die of starvation or old age.
+
+    Attributes
+    ----------
+    settings : GameSettings
+        Settings of every replicate. Any settings defining strategies and payoff (e.g. DoveHawkSettings) will do.
+    replicates : int
+        Number of replicates R.
+    payoff : array
+        The KxK payoff matrix.
+    longevity : array
+        Longevity of the organisms of each strategy.
+    alive : array
+        Mask of the slots holding living organisms, shape (R, capacity).
+    strategy : array
+        Strategy of the organism on each slot.
+    age : array
+        Age of the organism on each slot.
+    food_amount : array
+        Food particles available on each replicate.
+    metrics : tuple
+        Keys of the data gathered each epoch.
+    data : dict
+        Data of each epoch, mapping each metric to an array with its value on every replicate.
+    weight : array
+        Organisms each simulated organism stands for on every replicate, above 1 once subsampled to the memory
+        budget of the settings.
+    weights : list
+        The weights of every epoch.
+    """
+
+    def __init__(self, sim_settings, replicates, *strategy_traits, initial_counts=None):
+        """
+        Parameters
+        ---------
+        sim_settings : GameSettings
+            Settings of the simulation.
+        replicates : int
+            Number of replicates.
+        strategy_traits : Traits
+            Traits of the organisms of each strategy. Only longevity is relevant.
+        initial_counts : list
+            Number of organisms of each strategy in the initial population, either the same for every replicate
+            (length K) or one row per replicate (shape (R, K)). By default pop_size is split evenly.
+        """
+
+        self.settings = sim_settings
+        self.replicates = replicates
+        self.payoff = np.array(sim_settings.payoff, dtype=np.float64)
+        self.longevity = np.array([traits.longevity for traits in strategy_traits], dtype=np.int64)
+        k = len(strategy_traits)
+        if initial_counts is None:
+            initial_counts = [sim_settings.pop_size // k + (x < sim_settings.pop_size % k) for x in range(k)]
+        self.metrics = ('Population Size', 'Population Growth Rate') + \
+                       tuple('{} Population'.format(name) for name in sim_settings.strategies) + \
+                       tuple('{} Population Percentage'.format(name) for name in sim_settings.strategies)
+        self.data = {}
+        self.weight = np.ones(replicates)
+        self.weights = []
+
+        counts = np.broadcast_to(np.array(initial_counts, dtype=np.int64), (replicates, k))
+        replicate = np.repeat(np.repeat(np.arange(replicates), k), counts.ravel())
+        strategy = np.repeat(np.tile(np.arange(k), replicates), counts.ravel())
+        self.place(replicate, strategy, np.zeros(len(strategy), dtype=np.int64))
+        self.food_amount = self.gen_food()
+
+    def place(self, replicate, strategy, age):
+        """Lay organisms, given as flat arrays sorted by replicate, on fresh (R, capacity) arrays."""
+
+        sizes = np.bincount(replicate, minlength=self.replicates)
+        slot = np.arange(len(replicate)) - np.r_[0, np.cumsum(sizes)[:-1]][replicate]
+        shape = (self.replicates, max(1, sizes.max(initial=0)))
+
+        self.alive = np.zeros(shape, dtype=bool)
+        self.strategy = np.zeros(shape, dtype=np.int64)
+        self.age = np.zeros(shape, dtype=np.int64)
+        self.alive[replicate, slot] = True
+        self.strategy[replicate, slot] = strategy
+        self.age[replicate, slot] = age
+
+    def sizes(self):
+        return self.alive.sum(axis=1)
+
+    def gen_food(self):
+        """Amount of food of each replicate: fixed if food generation is static, proportional to each population
+        otherwise."""
+
+        if self.settings.static_food_generation:
+            return np.full(self.replicates, floor(self.settings.pop_size * self.settings.abundance), dtype=np.int64)
+        return np.floor(self.sizes() * self.settings.abundance).astype(np.int64)
+
+    def sim_competition(self):
+        """Make every organism of every replicate pick a food particle of its replicate, in rounds as PayoffGame
+        does. Food particles get global ids replicate * max_food + particle. Return the food of each slot (-1 if
+        none)."""
+
+        max_food = max(1, self.food_amount.max())
+        counts = np.zeros(self.replicates * max_food, dtype=np.int64)
+        # Particles beyond the amount of food of their replicate are never available.
+        counts[(np.arange(max_food)[None, :] >= self.food_amount[:, None]).ravel()] = 2
+
+        rows, cols = np.nonzero(self.alive)
+        food_of = np.full(self.alive.shape, -1, dtype=np.int64)
+        choosing = np.random.permutation(len(rows))
+
+        while choosing.size:
+            available = np.flatnonzero(counts < 2)
+            n_available = np.bincount(available // max_food, minlength=self.replicates)
+            offset = np.r_[0, np.cumsum(n_available)[:-1]]
+            choosing = choosing[n_available[rows[choosing]] > 0]
+            if not choosing.size:
+                break
+
+            replicate = rows[choosing]
+            choice = (np.random.random(len(choosing)) * n_available[replicate]).astype(np.int64)
+            picks = available[offset[replicate] + choice]
+            accepted = group_rank(picks) < 2 - counts[picks]
+            food_of[rows[choosing[accepted]], cols[choosing[accepted]]] = picks[accepted]
+            counts += np.bincount(picks[accepted], minlength=len(counts))
+            choosing = choosing[~accepted]
+
+        return food_of
+
+    def resolve(self, food_of):
+        """Return the meals of each slot once every encounter of every replicate is resolved."""
+
+        food_of, strategy = food_of.ravel(), self.strategy.ravel()
+        meals = np.zeros(len(food_of))
+
+        fed = np.flatnonzero(food_of >= 0)
+        order = fed[np.argsort(food_of[fed], kind='stable')]
+        food = food_of[order]
+        first = np.flatnonzero(food[1:] == food[:-1])
+        a, b = order[first], order[first + 1]
+        alone = np.ones(len(order), dtype=bool)
+        alone[first] = alone[first + 1] = False
+
+        meals[order[alone]] = 1
+        meals[a] = self.payoff[strategy[a], strategy[b]]
+        meals[b] = self.payoff[strategy[b], strategy[a]]
+
+        return meals.reshape(self.alive.shape)
+
+    def select(self, meals):
+        """Age every organism, kill the starving and the old and add the offspring of the lucky ones, as
+        BaseSimulator.fitness_function does for a single organism, then regulate the density of each population
+        as BaseSimulator.regulate does."""
+
+        settings = self.settings
+        alive = self.alive
+        sizes = self.sizes()
+        damping = np.ones(self.replicates)
+        if settings.carrying_capacity is not None and settings.regulation == 'logistic':
+            damping = np.clip(1 - sizes / settings.carrying_capacity, 0, None)
+
+        self.age[alive] += 1
+        fed = alive & (meals > 0) if settings.starvation else alive
+        chance = meals * settings.rep_factor * damping[:, None]
+        births = fed & (np.random.randint(0, 101, size=alive.shape) <= chance)
+        survivors = fed & (self.age < self.longevity[self.strategy])
+
+        survivor_rows, survivor_cols = np.nonzero(survivors)
+        birth_rows, birth_cols = np.nonzero(births)
+        replicate = np.r_[survivor_rows, birth_rows]
+        strategy = np.r_[self.strategy[survivor_rows, survivor_cols], self.strategy[birth_rows, birth_cols]]
+        age = np.r_[self.age[survivor_rows, survivor_cols], np.zeros(len(birth_rows), dtype=np.int64)]
+
+        order = np.argsort(replicate, kind='stable')
+        replicate, strategy, age = replicate[order], strategy[order], age[order]
+
+        # Culling to the carrying capacity and subsampling to the memory budget keep a uniform random sample of
+        # each population; only the latter makes the organisms left stand for more.
+        limit = np.inf
+        if settings.carrying_capacity is not None and settings.regulation == 'cull':
+            limit = settings.carrying_capacity
+        if settings.memory_budget is not None:
+            sizes = np.minimum(np.bincount(replicate, minlength=self.replicates), limit)
+            self.weight *= np.maximum(1, sizes / settings.memory_budget)
+            limit = min(limit, settings.memory_budget)
+        if limit < np.inf:
+            shuffled = np.random.permutation(len(replicate))
+            kept = np.sort(shuffled[group_rank(replicate[shuffled]) < limit])
+            replicate, strategy, age = replicate[kept], strategy[kept], age[kept]
+        self.weights.append(self.weight.copy())
+
+        self.place(replicate, strategy, age)
+
+    def get_step_data(self, epoch):
+        """Gather the population of each strategy on every replicate into the data dictionary.
+
+        Parameters
+        ----------
+        epoch : int
+            Current epoch of the simulation."""
+
+        k = len(self.payoff)
+        rows, cols = np.nonzero(self.alive)
+        counts = np.bincount(rows * k + self.strategy[rows, cols], minlength=self.replicates * k)
+        counts = counts.reshape(self.replicates, k)
+        sizes = counts.sum(axis=1)
+        growth = sizes - self.data[epoch - 1]['Population Size'] if epoch > 0 else np.zeros(self.replicates)
+        shares = np.divide(counts, sizes[:, None], out=np.zeros(counts.shape), where=sizes[:, None] > 0)
+
+        values = [sizes, growth] + list(counts.T) + list(shares.T)
+        self.data[epoch] = dict(zip(self.metrics, values))
+
+    def run_epoch(self, epoch):
+        """Simulate a single epoch of every replicate.
+
+        Parameters
+        ----------
+        epoch : int
+            Current epoch of the simulation."""
+
+        meals = self.resolve(self.sim_competition())
+        self.select(meals)
+        self.food_amount = self.gen_food()
+        self.get_step_data(epoch)
+
+    def simulate(self, store=None, replicate=0):
+        """Simulate every replicate for settings.steps epochs or until all of them go extinct.
+
+        Parameters
+        ----------
+        store : ResultsStore
+            If given, the data of each epoch is recorded on it. Replicates that went extinct have their last
+            epoch carried forward, as single simulations do when their population does.
+        replicate : int
+            Index of the store's replicate the first replicate is recorded as."""
+
+        for epoch in range(self.settings.steps + 1):
+            living = self.sizes() > 0
+            if not living.any():
+                break
+            self.run_epoch(epoch)
+            if store is not None:
+                store.record_replicates(replicate, epoch, self.data[epoch], living)
+
+        if store is not None:
+            for index in range(replicate, replicate + self.replicates):
+                store.fill(index)
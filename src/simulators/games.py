@@ -0,0 +1,230 @@
+"""Simulation of arbitrary symmetric games between K heritable strategies, given by a KxK payoff matrix.
+
+Dove/Hawk is the 2x2 instance defined by DoveHawkSettings (strategies Selfish and Altruistic). Hawk-Dove-
+Retaliator, for instance, only needs its 3x3 matrix:
+
+    settings = GameSettings(200, 30, 2, 100, 'hdr', strategies=['Hawk', 'Dove', 'Retaliator'],
+                            payoff=[[0.1, 1.0, 0.1], [0.0, 0.5, 0.4], [0.1, 0.6, 0.5]])
+    game = PayoffGame(settings, hawk_traits, dove_traits, retaliator_traits)
+    game.simulate()
+"""
+
+import copy
+import numpy as np
+from wallawin.src.simulators.altruisms.altruisms import BaseAltruism
+from wallawin.src.orgs import AltruisticOrganism
+
+
+class PayoffGame(BaseAltruism):
+    """Simulator in which all organisms look for a meal and a same meal may be found by two of them. Organisms
+    that find their meal alone eat it; competing ones get the meals the payoff matrix of the settings gives to
+    their strategy against the other's. All encounters of an epoch are resolved at once by indexing the
+    payoff matrix with the strategies of both sides.
+
+    Attributes
+    ----------
+    strategy_traits : list
+        Traits of the organisms of each strategy, in the order of the payoff matrix.
+    initial_counts : list
+        Number of organisms of each strategy in the initial population.
+    payoff : array
+        The KxK payoff matrix.
+    metrics : tuple
+        Keys of the data gathered each epoch.
+    """
+
+    def __init__(self, sim_settings, *strategy_traits, initial_counts=None):
+        """
+        Parameters
+        ---------
+        sim_settings : GameSettings
+            Settings of the simulation. Any settings defining strategies and payoff (e.g. DoveHawkSettings) will do.
+        strategy_traits : Traits
+            Traits of the organisms of each strategy.
+        initial_counts : list
+            Number of organisms of each strategy in the initial population. By default pop_size is split evenly.
+        """
+
+        self.payoff = np.array(sim_settings.payoff, dtype=np.float64)
+        self.strategy_traits = []
+        for strategy, traits in enumerate(strategy_traits):
+            traits = copy.copy(traits)
+            traits.strategy = strategy
+            self.strategy_traits.append(traits)
+        k = len(self.strategy_traits)
+        self.initial_counts = initial_counts or [sim_settings.pop_size // k + (x < sim_settings.pop_size % k)
+                                                 for x in range(k)]
+        self.metrics = ('Population Size', 'Population Growth Rate') + \
+                       tuple('{} Population'.format(name) for name in sim_settings.strategies) + \
+                       tuple('{} Population Percentage'.format(name) for name in sim_settings.strategies)
+        super().__init__(sim_settings, None)
+        self.food_of = np.empty(0, dtype=np.int64)
+
+    def gen_population(self, size):
+        return [AltruisticOrganism(self.env_size, traits)
+                for traits, count in zip(self.strategy_traits, self.initial_counts) for x in range(count)]
+
+    def strategies(self):
+        return np.array([org.traits.strategy for org in self.generation], dtype=np.int64)
+
+    def sim_competition(self):
+        """Make each organism pick a random food particle not chosen by two organisms yet, storing the choices in
+        food_of (-1 for organisms left without food). Organisms choose in rounds: all those still without food pick
+        at once among the available particles and, for each particle, the first ones in a random order get it."""
+
+        n, food_amount = len(self.generation), len(self.food)
+        self.food_of = np.full(n, -1, dtype=np.int64)
+        counts = np.zeros(food_amount, dtype=np.int64)
+        choosing = np.random.permutation(n)
+
+        while choosing.size:
+            available = np.flatnonzero(counts < 2)
+            if not available.size:
+                break
+            picks = available[np.random.randint(len(available), size=len(choosing))]
+            # Rank of each pick among those of the same particle, keeping the choosing order.
+            order = np.argsort(picks, kind='stable')
+            sorted_picks = picks[order]
+            starts = np.flatnonzero(np.r_[True, sorted_picks[1:] != sorted_picks[:-1]])
+            rank = np.empty(len(picks), dtype=np.int64)
+            rank[order] = np.arange(len(picks)) - np.repeat(starts, np.diff(np.r_[starts, len(picks)]))
+
+            accepted = rank < 2 - counts[picks]
+            self.food_of[choosing[accepted]] = picks[accepted]
+            counts += np.bincount(picks[accepted], minlength=food_amount)
+            choosing = choosing[~accepted]
+
+    def altruism(self):
+        """Resolve every encounter at once: organisms alone at their food get a meal, competing ones the payoff of
+        their strategy against their rival's."""
+
+        strategy = self.strategies()
+        meals = np.zeros(len(self.generation))
+
+        fed = np.flatnonzero(self.food_of >= 0)
+        order = fed[np.argsort(self.food_of[fed], kind='stable')]
+        food = self.food_of[order]
+        # At most two organisms share a particle, so rivals are consecutive once sorted by food.
+        first = np.flatnonzero(food[1:] == food[:-1])
+        a, b = order[first], order[first + 1]
+        alone = np.ones(len(order), dtype=bool)
+        alone[first] = alone[first + 1] = False
+
+        meals[order[alone]] = 1
+        meals[a] = self.payoff[strategy[a], strategy[b]]
+        meals[b] = self.payoff[strategy[b], strategy[a]]
+
+        for org, org_meals in zip(self.generation, meals):
+            org.meals = org_meals
+
+    def get_step_data(self, step):
+        """Gather the population of each strategy on the given epoch into the data dictionary.
+
+        Parameters
+        ----------
+        step : int
+            Current epoch (step) of the simulation."""
+
+        counts = np.bincount(self.strategies(), minlength=len(self.payoff))
+        pop_size = len(self.generation)
+        values = [pop_size, pop_size - self.data[step - 1]['Population Size'] if step > 0 else 0]
+        values += counts.tolist()
+        values += (counts / pop_size if pop_size else np.zeros(len(counts))).tolist()
+        self.data[step] = dict(zip(self.metrics, values))
+
+    def run_epoch(self, epoch):
+        """Simulate a single epoch: competition, resolution of encounters, selection and data gathering.
+
+        Parameters
+        ----------
+        epoch : int
+            Current epoch of the simulation."""
+
+        with self.phase('competition'):
+            self.sim_competition()
+        with self.phase('selection'):
+            self.evolve()
+        with self.phase('data'):
+            self.get_step_data(epoch)
+
+    def simulate(self, runs=1, store=None, replicate=0, detector=None):
+        """Simulate the evolution process for settings.steps epochs or until the population goes extinct.
+
+        Parameters
+        ----------
+        runs : int
+            Number of times the simulation will be run. Set to 1 by default.
+        store : ResultsStore
+            If given, the data of each epoch is recorded on it. Runs that settle or go extinct early have their
+            last epoch carried forward.
+        replicate : int
+            Index of the store's replicate the first run is recorded as. Following runs take the next ones.
+        detector : EquilibriumDetector
+            If given, each run stops as soon as the detector finds an equilibrium, fixation or extinction,
+            which is recorded in the equilibria dictionary."""
+
+        for run in range(0, runs):
+            if run > 0:
+                self.restart()
+            if detector is not None:
+                detector.reset()
+
+            for epoch in range(self.settings.steps + 1):
+                if not self.generation:
+                    break
+                self.run_epoch(epoch)
+                if store is not None:
+                    store.record(replicate + run, epoch, self.data[epoch])
+                if self.telemetry is not None:
+                    self.telemetry.publish(replicate + run, epoch, self.data[epoch])
+                if detector is not None and detector.update(epoch, self.data[epoch]):
+                    self.equilibria[run] = detector.summary()
+                    break
+            if store is not None:
+                store.fill(replicate + run)
+
+
+def replicator_dynamics(payoff, shares, epochs, dt=0.1):
+    """Integrate the replicator equation dx_i/dt = x_i ((Ax)_i - x.Ax) for a payoff matrix A with fourth order
+    Runge-Kutta steps. A deterministic, near instant baseline for what a PayoffGame simulation should approach
+    in a large population.
+
+    Parameters
+    ----------
+    payoff : list
+        The KxK payoff matrix.
+    shares : list
+        Initial share of each strategy in the population.
+    epochs : int
+        Number of unit time intervals to integrate.
+    dt : float
+        Integration step.
+
+    Returns
+    -------
+    array
+        Shares of each strategy at every epoch, shape (epochs + 1, K)."""
+
+    payoff = np.array(payoff, dtype=np.float64)
+    x = np.array(shares, dtype=np.float64)
+    x /= x.sum()
+
+    def derivative(x):
+        fitness = payoff @ x
+        return x * (fitness - x @ fitness)
+
+    steps = max(1, round(1 / dt))
+    h = 1 / steps
+    trajectory = [x.copy()]
+    for epoch in range(epochs):
+        for step in range(steps):
+            k1 = derivative(x)
+            k2 = derivative(x + h / 2 * k1)
+            k3 = derivative(x + h / 2 * k2)
+            k4 = derivative(x + h * k3)
+            x = x + h / 6 * (k1 + 2 * k2 + 2 * k3 + k4)
+            x = np.clip(x, 0, None)
+            x /= x.sum()
+        trajectory.append(x.copy())
+
+    return np.array(trajectory)
@@ -0,0 +1,194 @@
+"""Island model: the population is split into demes, each one simulated by its own simulator in its own
+process. Every few epochs a fraction of each deme migrates to the next one (demes form a ring) through
+shared memory buffers."""
+
+import copy
+import multiprocessing
+import random
+from math import ceil
+import numpy as np
+from wallawin.src.exc import SimulationError
+from wallawin.src.orgs import AltruisticOrganism
+from wallawin.src.settings import Traits
+
+# Fields of an organism written on a migration buffer.
+# Organisms with no strategy are written with strategy -1.
+ORG_FIELDS = ('altruistic', 'longevity', 'velocity', 'energy', 'energy_release', 'strategy', 'age')
+
+
+def pack_organisms(organisms, buffer):
+    """Write organisms on a buffer laid out as [count, org_0 fields..., org_1 fields..., ...]. Organisms that
+    don't fit are ignored. Return the amount written.
+
+    Parameters
+    ----------
+    organisms : list
+        Organisms to write.
+    buffer : array
+        Float array of length 1 + capacity * len(ORG_FIELDS)."""
+
+    capacity = (len(buffer) - 1) // len(ORG_FIELDS)
+    organisms = organisms[:capacity]
+    records = np.array([[org.traits.altruistic, org.traits.longevity, org.traits.velocity, org.traits.energy,
+                         org.traits.energy_release, -1 if org.traits.strategy is None else org.traits.strategy,
+                         org.age] for org in organisms], dtype=np.float64)
+    buffer[0] = len(organisms)
+    buffer[1:1 + records.size] = records.ravel()
+
+    return len(organisms)
+
+
+def unpack_organisms(buffer, env_size):
+    """Read the organisms written on a buffer by pack_organisms.
+
+    Parameters
+    ----------
+    buffer : array
+        Float array written by pack_organisms.
+    env_size : list
+        Size of the environment the organisms are placed in."""
+
+    count = int(buffer[0])
+    records = buffer[1:1 + count * len(ORG_FIELDS)].reshape(count, len(ORG_FIELDS))
+    organisms = []
+    for altruistic, longevity, velocity, energy, energy_release, strategy, age in records:
+        traits = Traits(bool(altruistic), int(longevity), velocity, energy, energy_release,
+                        None if strategy < 0 else int(strategy))
+        org = AltruisticOrganism(env_size, traits)
+        org.age = int(age)
+        organisms.append(org)
+
+    return organisms
+
+
+def deme_counts(simulator_class, sim_settings):
+    """Return the keys of the counts gathered on each deme every epoch: the population size and the population
+    of each allele, i.e. every '<name> Population' metric of the simulator."""
+
+    metrics = getattr(simulator_class, 'metrics', None)
+    if metrics is None:
+        # Simulators playing a game name their metrics after the strategies of their settings.
+        metrics = tuple('{} Population'.format(name) for name in sim_settings.strategies)
+
+    return ('Population Size',) + tuple(metric for metric in metrics if metric.endswith(' Population'))
+
+
+def run_deme(index, simulator_class, sim_settings, org_traits, migration_rate, migration_interval, buffers, counts,
+             keys, barrier, seed):
+    """Body of each deme's process. Simulates the deme epoch by epoch, writing its counts of the given keys on
+    the shared counts array, and exchanges migrants with its neighbours every migration_interval epochs."""
+
+    try:
+        random.seed(seed)
+        np.random.seed(seed)
+        demes, epochs = len(buffers), sim_settings.steps + 1
+        counts = np.frombuffer(counts).reshape(demes, epochs, len(keys))
+        outbox = np.frombuffer(buffers[index])
+        inbox = np.frombuffer(buffers[(index - 1) % demes])
+        simulator = simulator_class(sim_settings, *org_traits)
+
+        for epoch in range(epochs):
+            simulator.run_epoch(epoch)
+            counts[index, epoch] = [simulator.data[epoch][key] for key in keys]
+
+            if (epoch + 1) % migration_interval == 0 and epoch + 1 < epochs:
+                emigrants = random.sample(simulator.generation, round(migration_rate * len(simulator.generation)))
+                sent = pack_organisms(emigrants, outbox)
+                for org in emigrants[:sent]:
+                    simulator.kill(org)
+                barrier.wait()
+                simulator.generation.extend(unpack_organisms(inbox, simulator.env_size))
+                # Neighbours must be done reading before buffers are written again.
+                barrier.wait()
+    except BaseException:
+        barrier.abort()
+        raise
+
+
+class IslandModel:
+    """Runs a simulator as a set of demes in parallel processes with periodic migration between them.
+
+    Attributes
+    ----------
+    simulator_class : type
+        Simulator of each deme. It must define run_epoch, e.g. PredictableDoveOrHawk or PayoffGame.
+    sim_settings : SimSettings
+        Settings of the whole simulation. Its pop_size is split evenly among demes.
+    org_traits : list
+        Traits passed to each simulator after the settings.
+    demes : int
+        Number of demes (and processes).
+    migration_rate : float
+        Fraction of each deme that migrates to the next one on each migration.
+    migration_interval : int
+        Epochs between migrations.
+    migrant_capacity : int
+        Maximum number of organisms migrating from a deme at once.
+    counts : tuple
+        Keys of the counts gathered on each deme: the population size and the population of each allele.
+    deme_data : array
+        After simulating, the counts per deme and epoch, shape (demes, epochs, len(counts)).
+    data : dict
+        After simulating, global metrics of each epoch merging every deme's counts.
+    """
+
+    def __init__(self, simulator_class, sim_settings, org_traits, demes=4, migration_rate=0.1, migration_interval=5,
+                 migrant_capacity=1000):
+        self.simulator_class = simulator_class
+        self.sim_settings = sim_settings
+        self.org_traits = org_traits
+        self.demes = demes
+        self.migration_rate = migration_rate
+        self.migration_interval = migration_interval
+        self.migrant_capacity = migrant_capacity
+        self.counts = deme_counts(simulator_class, sim_settings)
+        self.deme_data = None
+        self.data = {}
+
+    def deme_settings(self, index):
+        settings = copy.copy(self.sim_settings)
+        settings.pop_size = ceil(self.sim_settings.pop_size / self.demes)
+        settings.simulation_name = '{}/deme_{}'.format(self.sim_settings.simulation_name, index)
+        return settings
+
+    def simulate(self, seed=None):
+        """Run every deme until settings.steps epochs are simulated and merge their counts.
+
+        Parameters
+        ----------
+        seed : int
+            Seed from which each deme's seed is drawn. Random by default."""
+
+        epochs = self.sim_settings.steps + 1
+        counts = multiprocessing.RawArray('d', self.demes * epochs * len(self.counts))
+        buffers = [multiprocessing.RawArray('d', 1 + self.migrant_capacity * len(ORG_FIELDS))
+                   for x in range(self.demes)]
+        barrier = multiprocessing.Barrier(self.demes)
+        seeds = np.random.default_rng(seed).integers(0, 2 ** 32, self.demes)
+
+        processes = [multiprocessing.Process(target=run_deme,
+                                             args=(index, self.simulator_class, self.deme_settings(index),
+                                                   self.org_traits, self.migration_rate, self.migration_interval,
+                                                   buffers, counts, self.counts, barrier, int(seeds[index])))
+                     for index in range(self.demes)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+
+        if any(process.exitcode != 0 for process in processes):
+            raise SimulationError('A deme of simulation {} failed.'.format(self.sim_settings.simulation_name))
+
+        self.deme_data = np.frombuffer(counts).reshape(self.demes, epochs, len(self.counts)).copy()
+        self.get_data()
+
+    def get_data(self):
+        """Merge the counts of every deme into global metrics, stored in the data dictionary: the counts and the
+        percentage of the population of each allele."""
+
+        totals = self.deme_data.sum(axis=0)
+        for epoch, values in enumerate(totals.astype(int).tolist()):
+            self.data[epoch] = dict(zip(self.counts, values))
+            pop_size = values[0]
+            for allele, population in zip(self.counts[1:], values[1:]):
+                self.data[epoch]['{} Percentage'.format(allele)] = population / pop_size if pop_size else 0
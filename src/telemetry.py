@@ -0,0 +1,176 @@
+"""Live metrics of running simulations.
+
+A simulation being monitored publishes, at most every interval seconds, a snapshot of its latest epoch (metrics,
+epochs per second and the mean time spent on each phase of an epoch) to a small memory mapped file under its data
+directory. Publishing only overwrites the file's pages, guarded by a sequence number readers check to discard
+torn snapshots, so a running simulation never waits on anyone looking at it. Snapshots are read with:
+
+    python -m wallawin.src.telemetry SIMULATION_NAME"""
+
+import argparse
+import json
+import mmap
+import os
+import struct
+import time
+from contextlib import contextmanager
+from wallawin.src.data_representation import DATA_PATH
+
+# Sequence number (odd while a snapshot is being written) and length of the snapshot.
+HEADER = struct.Struct('<QI')
+SIZE = 1 << 16
+
+
+def path(name):
+    return '{}/{}/telemetry'.format(DATA_PATH, name)
+
+
+class Telemetry:
+    """Publisher of the live metrics of a simulation.
+
+    Attributes
+    ----------
+    name : str
+        Name of the simulation.
+    interval : float
+        Minimum seconds between snapshots.
+    phases : dict
+        Seconds spent on each phase since the last snapshot.
+    """
+
+    def __init__(self, name, interval=0.5):
+        self.name = name
+        self.interval = interval
+        self.phases = {}
+        self.epochs = 0
+        self.seq = 0
+        self.latest = None
+        self.rate, self.phase_means = 0, {}
+        self.last_publish = self.started = time.monotonic()
+
+        os.makedirs('{}/{}'.format(DATA_PATH, name), exist_ok=True)
+        fd = os.open(path(name), os.O_RDWR | os.O_CREAT)
+        try:
+            os.ftruncate(fd, SIZE)
+            self.buffer = mmap.mmap(fd, SIZE)
+        finally:
+            os.close(fd)
+        HEADER.pack_into(self.buffer, 0, 0, 0)
+
+    @contextmanager
+    def phase(self, phase):
+        """Add the time spent in the block to the given phase."""
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[phase] = self.phases.get(phase, 0) + time.perf_counter() - start
+
+    def publish(self, run, epoch, step_data):
+        """Count an epoch and, if interval seconds passed since the last snapshot, publish a new one.
+
+        Parameters
+        ----------
+        run : int
+            Current run of the simulation.
+        epoch : int
+            Epoch the data belongs to.
+        step_data : dict
+            Dictionary mapping metric names to their values, as gathered by get_step_data."""
+
+        self.epochs += 1
+        self.latest = (run, epoch, step_data)
+        if time.monotonic() - self.last_publish >= self.interval:
+            self.snapshot(False)
+
+    def finish(self):
+        """Publish the last epoch as a final snapshot, telling viewers the simulation ended."""
+
+        if self.latest is not None:
+            self.snapshot(True)
+
+    def snapshot(self, finished):
+        now = time.monotonic()
+        if self.epochs:
+            # Final snapshots right after a regular one keep its rates.
+            self.rate = self.epochs / (now - self.last_publish)
+            self.phase_means = {phase: seconds / self.epochs for phase, seconds in self.phases.items()}
+        run, epoch, step_data = self.latest
+        snapshot = {'name': self.name, 'run': run, 'epoch': epoch, 'finished': finished,
+                    'elapsed': now - self.started, 'epochs_per_second': self.rate, 'phases': self.phase_means,
+                    'metrics': step_data}
+        self.write(json.dumps(snapshot, default=float).encode())
+        self.epochs = 0
+        self.phases = {}
+        self.last_publish = now
+
+    def write(self, payload):
+        payload = payload[:SIZE - HEADER.size]
+        self.seq += 1
+        HEADER.pack_into(self.buffer, 0, self.seq, 0)
+        self.buffer[HEADER.size:HEADER.size + len(payload)] = payload
+        self.seq += 1
+        HEADER.pack_into(self.buffer, 0, self.seq, len(payload))
+
+    def close(self):
+        self.buffer.close()
+
+
+def read_snapshot(name, attempts=10):
+    """Return the latest snapshot published by a simulation, or None if there is none (yet).
+
+    Parameters
+    ----------
+    name : str
+        Name of the simulation.
+    attempts : int
+        Times to try reading again a snapshot being written meanwhile."""
+
+    try:
+        with open(path(name), 'rb') as f:
+            buffer = mmap.mmap(f.fileno(), SIZE, access=mmap.ACCESS_READ)
+    except (FileNotFoundError, ValueError):
+        return None
+
+    with buffer:
+        for attempt in range(attempts):
+            seq, length = HEADER.unpack_from(buffer, 0)
+            payload = buffer[HEADER.size:HEADER.size + length]
+            if seq % 2 == 0 and HEADER.unpack_from(buffer, 0)[0] == seq:
+                return json.loads(payload) if seq else None
+            time.sleep(0.001)
+
+    return None
+
+
+def format_snapshot(snapshot):
+    lines = ['{} - run {} epoch {}{} - {:.1f} epochs/s - {:.0f}s elapsed'.format(
+        snapshot['name'], snapshot['run'], snapshot['epoch'], ' (finished)' if snapshot['finished'] else '',
+        snapshot['epochs_per_second'], snapshot['elapsed'])]
+    lines += ['    {:<45}{:.6g}'.format(metric, value) for metric, value in snapshot['metrics'].items()]
+    lines += ['    {:<45}{:.3f} ms/epoch'.format(phase, seconds * 1000)
+              for phase, seconds in snapshot['phases'].items()]
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='wallawin.telemetry', description='Follow the live metrics of a simulation.')
+    parser.add_argument('name', help='Name of the simulation.')
+    parser.add_argument('--interval', type=float, default=1.0, help='Seconds between reads.')
+    parser.add_argument('--once', action='store_true', help='Print the latest snapshot and exit.')
+    args = parser.parse_args(argv)
+
+    last = None
+    while True:
+        snapshot = read_snapshot(args.name)
+        if snapshot is not None and snapshot != last:
+            print(format_snapshot(snapshot), flush=True)
+            last = snapshot
+        if args.once or (snapshot is not None and snapshot['finished']):
+            return
+        time.sleep(args.interval)
+
+
+if __name__ == '__main__':
+    main()